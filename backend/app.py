@@ -1,7 +1,11 @@
+import os
+import sys
+from multiprocessing import freeze_support
 from flask import Flask
 from flask_restful import Api
 
 from urls import apply_resources
+from utils.startup import warm_up
 
 
 app = Flask(__name__)
@@ -10,4 +14,13 @@ api = Api(app)
 apply_resources(api)
 
 if __name__ == '__main__':
+    # Scrape pools start worker processes from the frozen executable too
+    freeze_support()
+    if sys.argv[1:2] == ['worker']:
+        # Lets the packaged executable run distributed parse workers too
+        from worker import main
+        main(sys.argv[2:])
+        sys.exit()
+    if not os.environ.get('SITE_PARSER_NO_WARM_UP'):
+        warm_up()
     app.run(debug=False, use_reloader=False)
@@ -0,0 +1,172 @@
+"""Synthetic bhf.io and lolz.guru pages
+
+Pages carry the markup the crawlers and scrapers read and nothing else,
+sized by a FixtureConfig. The same arguments always produce the same page.
+"""
+import random
+from datetime import datetime, timedelta
+from html import escape
+from collections import namedtuple
+
+
+FixtureConfig = namedtuple(
+    'FixtureConfig',
+    ('search_pages', 'threads_per_search_page', 'thread_pages',
+     'messages_per_page', 'words_per_message', 'quote_ratio')
+)
+DEFAULT_CONFIG = FixtureConfig(
+    search_pages=5, threads_per_search_page=20, thread_pages=3,
+    messages_per_page=20, words_per_message=40, quote_ratio=0.2
+)
+
+# Every generated message has one of these, so any of them finds messages
+KEYWORDS = ('одесса', 'харьков', 'аккаунт', 'гарант')
+WORDS = (
+    'продам куплю обмен сделка доставка цена недорого отзыв заказ товар '
+    'логин пароль схема карта банк телефон Москва Питер Киев биткоин '
+    'spam offer account seller buyer escrow wallet'
+).split()
+LOLZ_MONTHS = ('янв', 'фев', 'мар', 'апр', 'май', 'июн',
+               'июл', 'авг', 'сен', 'окт', 'ноя', 'дек')
+FIRST_DATE = datetime(2020, 1, 1, 12, 0)
+# Links every Bing page has, results or not
+BING_NAVIGATION = (
+    '<header><a href="https://www.bing.com/images">Images</a>'
+    '<a href="https://www.bing.com/videos">Videos</a>'
+    '<a href="https://www.microsoft.com/">Microsoft</a></header>'
+)
+BING_FOOTER = (
+    '<footer><a href="https://go.microsoft.com/fwlink/?LinkID=1">Help</a>'
+    '<a href="https://go.microsoft.com/fwlink/?LinkId=521839">Privacy</a>'
+    '</footer>'
+)
+
+
+def _rng(*seed) -> random.Random:
+    # String seeds, unlike hash(), are stable across processes
+    return random.Random(':'.join(map(str, seed)))
+
+
+def _text(rng: random.Random, config: FixtureConfig) -> str:
+    words = [rng.choice(WORDS) for _ in range(config.words_per_message)]
+    words.insert(rng.randrange(len(words) + 1), rng.choice(KEYWORDS))
+    return escape(' '.join(words))
+
+
+def _date(thread_id: int, page: int, position: int) -> datetime:
+    return FIRST_DATE + timedelta(days=thread_id, hours=page,
+                                  minutes=position)
+
+
+def bhf_main_page() -> str:
+    return ('<html><body><form action="/search/search" method="post">'
+            '<input type="hidden" name="_xfToken" value="benchmark,token">'
+            '</form></body></html>')
+
+
+def bhf_search_page(page: int, config: FixtureConfig = DEFAULT_CONFIG,
+                    query: str = '') -> str:
+    first_thread = (page - 1) * config.threads_per_search_page
+    results = ''.join(
+        f'<li class="block-row"><h3 class="contentRow-title">'
+        f'<a href="/threads/thread.{thread_id}/">Thread {thread_id}</a>'
+        f'</h3></li>'
+        for thread_id in range(first_thread,
+                               first_thread + config.threads_per_search_page)
+    )
+    query = escape(query)
+    next_link = (
+        f'<link rel="next" href="/search/1/?page={page + 1}&amp;q={query}">'
+        if page < config.search_pages else ''
+    )
+    navigation = ''.join(
+        f'<li class="pageNav-page"><a href="/search/1/?page={number}'
+        f'&amp;q={query}">{number}</a></li>'
+        for number in range(1, config.search_pages + 1)
+    )
+    return (f'<html><head>{next_link}</head><body>'
+            f'<div uix_component="MainContent"><ol class="block-body">'
+            f'{results}</ol><ul class="pageNav-main">{navigation}</ul>'
+            f'</div></body></html>')
+
+
+def bhf_no_results_page() -> str:
+    return ('<html><body><div uix_component="MainContent">'
+            '<div class="blockMessage">No results found.</div>'
+            '</div></body></html>')
+
+
+def bhf_thread_page(thread_id: int, page: int,
+                    config: FixtureConfig = DEFAULT_CONFIG) -> str:
+    rng = _rng('bhf', thread_id, page)
+    messages = []
+    for position in range(config.messages_per_page):
+        quote = ''
+        if rng.random() < config.quote_ratio:
+            quote = (f'<blockquote class="bbCodeBlock bbCodeBlock--quote">'
+                     f'{_text(rng, config)}</blockquote>')
+        date = _date(thread_id, page, position)
+        messages.append(
+            f'<article class="message message--post">'
+            f'<h4 class="message-name"><a class="username '
+            f'username--style2">user{rng.randrange(1000)}</a></h4>'
+            f'<time class="u-dt" datetime="'
+            f'{date.strftime("%Y-%m-%dT%H:%M:%S")}+0300"></time>'
+            f'<div class="bbWrapper">{quote}{_text(rng, config)}<br>'
+            f'{_text(rng, config)}</div></article>'
+        )
+    next_link = (
+        f'<link rel="next" href="/threads/thread.{thread_id}/'
+        f'page-{page + 1}">' if page < config.thread_pages else ''
+    )
+    return (f'<html><head>{next_link}</head><body>{"".join(messages)}'
+            f'</body></html>')
+
+
+def lolz_search_page(page: int, config: FixtureConfig = DEFAULT_CONFIG,
+                     site_url: str = 'https://lolz.guru') -> str:
+    """Stand-in for the Bing results pages the Lolz crawler reads"""
+    first_thread = (page - 1) * config.threads_per_search_page
+    results = ''.join(
+        f'<li class="b_algo"><h2><a href="{site_url}/threads/{thread_id}/">'
+        f'Thread {thread_id}</a></h2><div class="b_caption"><cite>'
+        f'{site_url}</cite><a href="https://www.bing.com/translator">'
+        f'Translate</a></div></li>'
+        for thread_id in range(first_thread,
+                               first_thread + config.threads_per_search_page)
+    )
+    if page < config.search_pages:
+        next_link = f'<a class="sb_pagN" href="/search?page={page + 1}">' \
+                    f'Next</a>'
+    else:
+        next_link = '<a class="sb_pagN sb_inactP">Next</a>'
+    return (f'<html><body>{BING_NAVIGATION}<ol id="b_results">{results}'
+            f'</ol>{next_link}{BING_FOOTER}</body></html>')
+
+
+def lolz_thread_page(thread_id: int, page: int,
+                     config: FixtureConfig = DEFAULT_CONFIG) -> str:
+    rng = _rng('lolz', thread_id, page)
+    messages = []
+    for position in range(config.messages_per_page):
+        date = _date(thread_id, page, position)
+        date_text = (f'{date.day} {LOLZ_MONTHS[date.month - 1]} '
+                     f'{date.year} в {date:%H:%M}')
+        if position % 2:
+            date_html = f'<span class="DateTime" title="{date_text}">' \
+                        f'{date.day} {LOLZ_MONTHS[date.month - 1]}</span>'
+        else:
+            date_html = f'<abbr class="DateTime">{date_text}</abbr>'
+        tag = 'comment' if rng.random() < 0.1 else 'message'
+        messages.append(
+            f'<li class="{tag}" data-author="user{rng.randrange(1000)}">'
+            f'<blockquote class="messageText baseHtml">'
+            f'{_text(rng, config)}<br>"{_text(rng, config)}"</blockquote>'
+            f'<div class="messageMeta">{date_html}</div></li>'
+        )
+    next_link = (
+        f'<link rel="next" href="/threads/{thread_id}/page-{page + 1}">'
+        if page < config.thread_pages else ''
+    )
+    return (f'<html><head>{next_link}</head><body><ol class="messageList">'
+            f'{"".join(messages)}</ol></body></html>')
@@ -0,0 +1,74 @@
+"""Keyword matching micro-benchmarks
+
+Compares a per-term substring filter, like the one scrapers use for a
+single search term, with KeywordMatcher on synthetic forum messages.
+
+    python -m benchmarks.matcher [--messages N]
+"""
+import random
+import argparse
+import timeit
+
+from parsing.matcher import KeywordMatcher, SUBSTRING_SEARCH_LIMIT
+
+
+WORDS = (
+    'одесса харьков киев продам куплю аккаунт переписка логин пароль '
+    'Москва Питер доставка гарант сделка обмен биткоин карта телефон '
+    'Ёлка ЁЖИК приват банк схема отзыв заказ товар цена недорого'
+).split()
+TERM_COUNTS = (10, 100, 1000)
+
+
+def make_messages(count: int, words_per_message: int = 60):
+    rng = random.Random(0)
+    return [' '.join(rng.choice(WORDS) + rng.choice(('', 'ов', 'а', 'ами'))
+                     for _ in range(words_per_message))
+            for _ in range(count)]
+
+
+def make_terms(count: int):
+    rng = random.Random(count)
+    terms = list(WORDS)
+    while len(terms) < count:
+        terms.append(' '.join(rng.sample(WORDS, 2)) + str(len(terms)))
+    return terms[:count]
+
+
+def substring_filter(messages, terms):
+    # What filtering each term's results on its own costs
+    return [[term for term in terms if term.lower() in message.lower()]
+            for message in messages]
+
+
+def best_of(func, repeat: int = 5) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument('--messages', type=int, default=1000)
+    args = argparser.parse_args()
+
+    messages = make_messages(args.messages)
+    print(f'{args.messages} messages, automaton above '
+          f'{SUBSTRING_SEARCH_LIMIT} terms')
+    print(f'{"terms":>6} {"substring, ms":>14} {"matcher, ms":>12} '
+          f'{"compile, ms":>12}')
+    for count in TERM_COUNTS:
+        terms = make_terms(count)
+        matcher = KeywordMatcher(terms)
+        expected = [set(found) for found in substring_filter(messages, terms)]
+        assert [set(matcher.match(message)) for message in messages] \
+            == expected
+
+        substring = best_of(lambda: substring_filter(messages, terms))
+        matching = best_of(lambda: [matcher.match(message)
+                                    for message in messages])
+        compiling = best_of(lambda: KeywordMatcher(terms))
+        print(f'{count:>6} {substring * 1000:>14.1f} {matching * 1000:>12.1f} '
+              f'{compiling * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,355 @@
+"""Crawl, scrape and parse_messages benchmarks against local fixtures
+
+Each benchmark runs in its own process, so its peak RSS is its own, and
+reports pages/sec, messages/sec, peak RSS and p50/p95 latency per page.
+Results can be appended to a JSON lines file to follow them over time.
+
+    python -m benchmarks.runner [scrapers bhf_crawler ...] [--output FILE]
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import tempfile
+import datetime
+import subprocess
+import statistics
+
+from typing import Callable, Dict, Iterable, Iterator, List
+from benchmarks import fixtures
+from benchmarks.fixtures import FixtureConfig
+from benchmarks.server import ForumServer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(func: Callable) -> Callable:
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+class Timer:
+    """Times the items of an iterable as the consumer receives them"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.started = self.finished = None
+
+    def iterate(self, items: Iterable) -> Iterator:
+        self.started = last = time.perf_counter()
+        try:
+            for item in items:
+                now = time.perf_counter()
+                self.latencies.append(now - last)
+                yield item
+                last = time.perf_counter()
+        finally:
+            self.finished = time.perf_counter()
+
+    def time(self, func: Callable, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+    @property
+    def elapsed(self) -> float:
+        if self.finished is None:
+            return sum(self.latencies)
+        return self.finished - self.started
+
+
+def peak_rss() -> int:
+    """Peak resident set size of the process in bytes, 0 if unknown"""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100,
+                                method='inclusive')[round(fraction * 100) - 1]
+
+
+def report(name: str, timer: Timer, pages: int, messages: int,
+           **extra) -> dict:
+    elapsed = timer.elapsed or float('nan')
+    return {
+        'benchmark': name,
+        'pages': pages,
+        'messages': messages,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 1),
+        'messages_per_sec': round(messages / elapsed, 1),
+        'peak_rss_mb': round(peak_rss() / 2 ** 20, 1),
+        'p50_ms': round(percentile(timer.latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(timer.latencies, 0.95) * 1000, 2),
+        **extra,
+    }
+
+
+def fixture_config(args) -> FixtureConfig:
+    return FixtureConfig(
+        search_pages=args.search_pages,
+        threads_per_search_page=args.threads_per_search_page,
+        thread_pages=args.thread_pages,
+        messages_per_page=args.messages_per_page,
+        words_per_message=args.words_per_message,
+        quote_ratio=fixtures.DEFAULT_CONFIG.quote_ratio,
+    )
+
+
+def forum_server(site: str, args) -> ForumServer:
+    return ForumServer(site, fixture_config(args), latency=args.latency,
+                       jitter=args.jitter, error_rate=args.error_rate,
+                       error_status=args.error_status,
+                       retry_after=args.retry_after or None)
+
+
+def local_session(session_manager):
+    """Make a session manager reach the local server without proxies"""
+    from utils.proxies import ProxyManager
+    session_manager.proxies = ProxyManager(
+        types.SimpleNamespace(proxy_pool=iter(()))
+    )
+    return session_manager
+
+
+@benchmark
+def scrapers(args) -> List[dict]:
+    from parsing.scrape import BHFScraper, LolzScraper
+    from parsing.html_backends import BACKENDS, get_backend
+
+    config = fixture_config(args)
+    pages = {
+        BHFScraper: [fixtures.bhf_thread_page(thread, 1, config)
+                     for thread in range(args.pages)],
+        LolzScraper: [fixtures.lolz_thread_page(thread, 1, config)
+                      for thread in range(args.pages)],
+    }
+    results = []
+    for backend_name in BACKENDS:
+        try:
+            backend = get_backend(backend_name)
+        except ValueError:
+            continue
+        for scraper_class, htmls in pages.items():
+            scraper = scraper_class(backend)
+            timer = Timer()
+            messages = sum(len(timer.time(scraper.get_all_messages, html))
+                           for html in htmls)
+            results.append(report(f'{scraper_class.__name__}/{backend_name}',
+                                  timer, len(htmls), messages))
+    return results
+
+
+@benchmark
+def bhf_crawler(args) -> List[dict]:
+    from parsing.crawl import BHFCrawler
+    from parsing.session_managers import BHFSessionManager
+
+    with forum_server('bhf', args) as server:
+        crawler = BHFCrawler(
+            session_manager=local_session(
+                BHFSessionManager(server.url, use_cache=False)
+            ),
+            main_page_link=server.url
+        )
+        return [crawl('bhf_crawler', crawler, server, args)]
+
+
+@benchmark
+def lolz_crawler(args) -> List[dict]:
+    from parsing.crawl import LolzCrawler
+    from parsing.serp import BingSearch
+    from parsing.session_managers import SessionManager
+
+    with forum_server('lolz', args) as server:
+        # The server stands in for the search engine too
+        search_engine = BingSearch(
+            server.url,
+            session_manager=local_session(SessionManager(use_cache=False)),
+            user_agents=['benchmark']
+        )
+        crawler = LolzCrawler(
+            session_manager=local_session(SessionManager(use_cache=False)),
+            main_page_link=server.url,
+            search_engine=search_engine
+        )
+        return [crawl('lolz_crawler', crawler, server, args)]
+
+
+def crawl(name: str, crawler, server: ForumServer, args) -> dict:
+    timer = Timer()
+    pages = list(timer.iterate(crawler.search(
+        fixtures.KEYWORDS[0], one_page_only=False, max_pages=args.search_pages
+    )))
+    messages = sum(len(crawler.scraper.get_all_messages(page.html))
+                   for page in pages)
+    return report(name, timer, len(pages), messages,
+                  server_requests=server.requests,
+                  server_errors=server.errors)
+
+
+@benchmark
+def parse_messages(args) -> List[dict]:
+    from parsing.parse import parse_messages
+    from parsing.progress import Progress
+    from parsing.crawl import BHFCrawler
+    from parsing.session_managers import BHFSessionManager
+    from parsing.message_index import MessageIndex
+
+    with forum_server('bhf', args) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        crawler = BHFCrawler(
+            session_manager=local_session(
+                BHFSessionManager(server.url, use_cache=False)
+            ),
+            main_page_link=server.url
+        )
+        timer = Timer()
+        search = crawler.search
+        crawler.search = lambda *args, **kwargs: \
+            timer.iterate(search(*args, **kwargs))
+
+        message_index = MessageIndex(
+            os.path.join(directory, 'messages.sqlite3')
+        ) if args.index_messages else None
+        progress = Progress()
+        started = time.perf_counter()
+        parse_messages(crawler, fixtures.KEYWORDS,
+                       os.path.join(directory, f'messages.{args.format}'),
+                       False, args.search_pages, progress=progress,
+                       concurrency=args.concurrency,
+                       parse_workers=args.parse_workers,
+                       export_format=args.format,
+                       page_memory_mb=args.page_memory_mb,
+                       spill_pages=args.over_budget == 'spill',
+                       message_index=message_index)
+        timer.started, timer.finished = started, time.perf_counter()
+
+        counters = progress.as_dict()
+        budget = crawler.memo.budget.stats() if crawler.memo.budget else {}
+        indexed = message_index.stats() if message_index else {}
+        return [report('parse_messages', timer, counters['pages_fetched'],
+                       counters['messages_written'],
+                       server_requests=server.requests,
+                       format=args.format, **budget,
+                       indexed_messages=indexed.get('messages', 0))]
+
+
+OPTIONS = (
+    ('--pages', int, 200, 'pages per scraper benchmark'),
+    ('--search-pages', int, 5, 'search result pages per term'),
+    ('--threads-per-search-page', int, 20, 'threads on a result page'),
+    ('--thread-pages', int, 3, 'pages per thread'),
+    ('--messages-per-page', int, 20, 'messages on a thread page'),
+    ('--words-per-message', int, 40, 'words in a message'),
+    ('--latency', float, 0.05, 'server response delay, seconds'),
+    ('--jitter', float, 0.02, 'random delay added or taken, seconds'),
+    ('--error-rate', float, 0.0, 'share of responses failing'),
+    ('--error-status', int, 500, '500, 429, 503 or 403 (a challenge page)'),
+    ('--retry-after', float, 0.0, 'Retry-After of 429 and 503, seconds'),
+    ('--concurrency', int, 4, 'terms crawled at once by parse_messages'),
+    ('--parse-workers', int, 0, 'scrape worker processes'),
+    ('--format', str, 'xlsx', 'parse_messages export format'),
+    ('--page-memory-mb', int, 0, 'parse_messages page HTML budget, MB'),
+    ('--over-budget', str, 'pause', 'pause or spill pages past the budget'),
+    ('--index-messages', int, 0, '1 to add the messages to a message index'),
+)
+
+
+def run_isolated(name: str, argv: List[str]) -> List[dict]:
+    """Run one benchmark in a fresh interpreter"""
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.runner', name, '--in-process',
+         '--json', *argv],
+        stdout=subprocess.PIPE, universal_newlines=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    if completed.returncode:
+        print(f'Benchmark {name} failed', file=sys.stderr)
+        return []
+    return [json.loads(line) for line in completed.stdout.splitlines()
+            if line.startswith('{')]
+
+
+def revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True
+        ).stdout.strip()
+    except OSError:
+        return ''
+
+
+def print_table(results: List[dict]):
+    columns = ('benchmark', 'pages_per_sec', 'messages_per_sec',
+               'peak_rss_mb', 'p50_ms', 'p95_ms')
+    print(f'{columns[0]:<24}' + ''.join(f'{column:>18}'
+                                        for column in columns[1:]))
+    for result in results:
+        print(f'{result["benchmark"]:<24}' + ''.join(
+            f'{result[column]:>18}' for column in columns[1:]
+        ))
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                           help=f'any of {", ".join(BENCHMARKS)}, all by '
+                                f'default')
+    for option, option_type, default, help_text in OPTIONS:
+        argparser.add_argument(option, type=option_type, default=default,
+                               help=help_text)
+    argparser.add_argument('--output', help='append results to this file')
+    argparser.add_argument('--in-process', action='store_true',
+                           help=argparse.SUPPRESS)
+    argparser.add_argument('--json', action='store_true',
+                           help=argparse.SUPPRESS)
+    args = argparser.parse_args()
+    names = args.benchmarks or list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        argparser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    if args.in_process:
+        results = [result for name in names
+                   for result in BENCHMARKS[name](args)]
+    else:
+        argv = [f'{option}={getattr(args, option[2:].replace("-", "_"))}'
+                for option, *_ in OPTIONS]
+        results = [result for name in names
+                   for result in run_isolated(name, argv)]
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+    print_table(results)
+
+    if args.output:
+        recorded = {'time': datetime.datetime.now().isoformat(
+                        timespec='seconds'),
+                    'revision': revision()}
+        with open(args.output, 'a') as output:
+            for result in results:
+                output.write(json.dumps({**recorded, **result}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Local stand-in for bhf.io and lolz.guru serving synthetic pages
+
+    python -m benchmarks.server bhf --port 8081 --latency 0.1
+"""
+import time
+import random
+import asyncio
+import argparse
+import threading
+from aiohttp import web
+
+from typing import List
+from benchmarks import fixtures
+from benchmarks.fixtures import FixtureConfig, DEFAULT_CONFIG
+
+
+SITES = ('bhf', 'lolz')
+NO_RESULTS_QUERY = 'nothing'
+ERROR_STATUSES = (500, 429, 503, 403)
+# What Cloudflare serves in place of a page it wants a browser check for
+CHALLENGE_PAGE = (
+    '<html><head><title>Just a moment...</title></head><body>'
+    '<div id="cf-browser-verification">Checking your browser before '
+    'accessing the site.</div></body></html>'
+)
+
+
+class ForumServer:
+    """Serves one site's pages on a background event loop
+
+    Every response is delayed by `latency` seconds give or take `jitter`,
+    and fails with `error_status` with probability `error_rate`: 429 and
+    503 carry a `retry_after` header when one is set, 403 is a Cloudflare
+    challenge page. Response times as the server saw them are kept in
+    `latencies`.
+    """
+
+    def __init__(self, site: str, config: FixtureConfig = DEFAULT_CONFIG, *,
+                 host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500,
+                 retry_after: float = None):
+        if site not in SITES:
+            raise ValueError(f'Unknown site "{site}"')
+        if error_status not in ERROR_STATUSES:
+            raise ValueError(f'Unsupported error status {error_status}')
+        self.site = site
+        self.config = config
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.requests = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+        self._random = random.Random(0)
+        self._loop = None
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def start(self) -> 'ForumServer':
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=serve, name=f'{self.site}-server',
+                         daemon=True).start()
+        started.wait()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(),
+                                         self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def __enter__(self) -> 'ForumServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    async def _start(self):
+        app = web.Application(middlewares=[self._delay])
+        if self.site == 'bhf':
+            app.router.add_get('/', self._bhf_main)
+            app.router.add_post('/search/search', self._bhf_search)
+            app.router.add_get('/search/1/', self._bhf_search_page)
+            app.router.add_get('/threads/thread.{thread:\\d+}/',
+                               self._bhf_thread)
+            app.router.add_get('/threads/thread.{thread:\\d+}/'
+                               'page-{page:\\d+}', self._bhf_thread)
+        else:
+            app.router.add_get('/search', self._lolz_search)
+            app.router.add_get('/threads/{thread:\\d+}/', self._lolz_thread)
+            app.router.add_get('/threads/{thread:\\d+}/page-{page:\\d+}',
+                               self._lolz_thread)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    @web.middleware
+    async def _delay(self, request: web.Request, handler):
+        started = time.monotonic()
+        self.requests += 1
+        delay = self.latency + self._random.uniform(-self.jitter,
+                                                    self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            response = self._error()
+        else:
+            response = await handler(request)
+        self.latencies.append(time.monotonic() - started)
+        return response
+
+    def _error(self) -> web.Response:
+        if self.error_status == 403:
+            return web.Response(status=403, text=CHALLENGE_PAGE,
+                                content_type='text/html',
+                                headers={'cf-mitigated': 'challenge'})
+        headers = {}
+        if self.retry_after is not None and self.error_status != 500:
+            headers['Retry-After'] = f'{self.retry_after:g}'
+        return web.Response(status=self.error_status, headers=headers,
+                            text='Synthetic error')
+
+    @staticmethod
+    def _html(text: str) -> web.Response:
+        return web.Response(text=text, content_type='text/html',
+                            charset='utf-8')
+
+    @staticmethod
+    def _page(request: web.Request, name: str = 'page') -> int:
+        return int(request.match_info.get(name) or
+                   request.query.get(name) or 1)
+
+    async def _bhf_main(self, request: web.Request) -> web.Response:
+        return self._html(fixtures.bhf_main_page())
+
+    async def _bhf_search(self, request: web.Request) -> web.Response:
+        query = (await request.post()).get('keywords', '')
+        if query == NO_RESULTS_QUERY:
+            return self._html(fixtures.bhf_no_results_page())
+        return self._html(fixtures.bhf_search_page(1, self.config, query))
+
+    async def _bhf_search_page(self, request: web.Request) -> web.Response:
+        return self._html(fixtures.bhf_search_page(
+            self._page(request), self.config, request.query.get('q', '')
+        ))
+
+    async def _bhf_thread(self, request: web.Request) -> web.Response:
+        return self._html(fixtures.bhf_thread_page(
+            int(request.match_info['thread']), self._page(request),
+            self.config
+        ))
+
+    async def _lolz_search(self, request: web.Request) -> web.Response:
+        return self._html(fixtures.lolz_search_page(self._page(request),
+                                                    self.config, self.url))
+
+    async def _lolz_thread(self, request: web.Request) -> web.Response:
+        return self._html(fixtures.lolz_thread_page(
+            int(request.match_info['thread']), self._page(request),
+            self.config
+        ))
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument('site', choices=SITES)
+    argparser.add_argument('--port', type=int, default=8080)
+    argparser.add_argument('--latency', type=float, default=0.0)
+    argparser.add_argument('--jitter', type=float, default=0.0)
+    argparser.add_argument('--error-rate', type=float, default=0.0)
+    argparser.add_argument('--error-status', type=int, default=500,
+                           choices=ERROR_STATUSES)
+    argparser.add_argument('--retry-after', type=float)
+    args = argparser.parse_args()
+
+    server = ForumServer(args.site, port=args.port, latency=args.latency,
+                         jitter=args.jitter, error_rate=args.error_rate,
+                         error_status=args.error_status,
+                         retry_after=args.retry_after)
+    with server:
+        print(f'Serving {args.site} pages on {server.url}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
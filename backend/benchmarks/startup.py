@@ -0,0 +1,72 @@
+"""Backend cold-start benchmark with a time budget
+
+Measures, in fresh interpreters, how long importing the app takes and how
+long `python app.py` takes to answer its first request, the way
+startServer.js starts it. Exits with 1 when the median time to the first
+answer exceeds the budget.
+
+    python -m benchmarks.startup [--runs 5] [--budget 0.8]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from urllib.error import URLError
+from urllib.request import urlopen
+
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_URL = 'http://127.0.0.1:5000/jobs'
+IMPORT_APP = ('import time; started = time.perf_counter(); import app; '
+              'print(time.perf_counter() - started)')
+
+
+def import_time() -> float:
+    completed = subprocess.run([sys.executable, '-c', IMPORT_APP],
+                               stdout=subprocess.PIPE, cwd=BACKEND,
+                               universal_newlines=True, check=True)
+    return float(completed.stdout.split()[-1])
+
+
+def first_answer_time(timeout: float = 30) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, 'app.py'], cwd=BACKEND,
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError('The app exited before answering')
+            try:
+                with urlopen(APP_URL, timeout=1):
+                    return time.perf_counter() - started
+            except (URLError, ConnectionError):
+                time.sleep(0.01)
+        raise RuntimeError(f'The app did not answer in {timeout} seconds')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument('--runs', type=int, default=5)
+    argparser.add_argument('--budget', type=float, default=0.8,
+                           help='seconds allowed until the first answer')
+    args = argparser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    answers = [first_answer_time() for _ in range(args.runs)]
+    print(f'import app:    median {statistics.median(imports):.3f}s, '
+          f'max {max(imports):.3f}s')
+    print(f'first answer:  median {statistics.median(answers):.3f}s, '
+          f'max {max(answers):.3f}s, budget {args.budget:.3f}s')
+    if statistics.median(answers) > args.budget:
+        print('Startup budget exceeded')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+from array import array
+from datetime import datetime
+
+from typing import Dict, Iterable, Iterator, List, Optional
+from parsing.dates import to_datetime
+
+
+class MessageBatch:
+    """Messages of a page stored column by column
+
+    Dates are int64 epoch seconds, usernames are indices into a table
+    holding each distinct name once, and texts are slices of one string.
+    Compared to a tuple of objects per message this takes a fraction of
+    the memory and pickles to a few flat buffers, which is what scrape
+    workers send back.
+    """
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.usernames = array('i')
+        self.text_ends = array('q')
+        self.strings: List[str] = []
+        self._texts: List[str] = []
+        self._buffer = ''
+        self._string_ids: Dict[str, int] = {}
+
+    def append(self, timestamp: int, username: str, text: str):
+        self.timestamps.append(timestamp)
+        self.usernames.append(self._intern(username))
+        self._texts.append(text)
+        self.text_ends.append(
+            (self.text_ends[-1] if self.text_ends else 0) + len(text)
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __iter__(self) -> Iterator['MessageView']:
+        return (MessageView(self, index) for index in range(len(self)))
+
+    def text(self, index: int) -> str:
+        start = self.text_ends[index - 1] if index else 0
+        return self.buffer[start:self.text_ends[index]]
+
+    def texts(self) -> Iterator[str]:
+        buffer, start = self.buffer, 0
+        for end in self.text_ends:
+            yield buffer[start:end]
+            start = end
+
+    def username(self, index: int) -> Optional[str]:
+        return self._string(self.usernames[index])
+
+    def select(self, indices: Iterable[int]) -> 'MessageBatch':
+        """A batch of the messages at `indices`, in that order"""
+        selected = MessageBatch()
+        for index in indices:
+            selected.append(self.timestamps[index], self.username(index),
+                            self.text(index))
+        return selected
+
+    def newer_than(self, timestamp: float) -> 'MessageBatch':
+        return self.select(index for index, message_time
+                           in enumerate(self.timestamps)
+                           if message_time > timestamp)
+
+    def as_dict(self) -> dict:
+        """The messages as JSON serializable columns"""
+        return {
+            'timestamps': self.timestamps.tolist(),
+            'usernames': [self.username(index) for index in range(len(self))],
+            'texts': list(self.texts()),
+        }
+
+    @classmethod
+    def from_dict(cls, columns: dict) -> 'MessageBatch':
+        batch = cls()
+        rows = zip(columns['timestamps'], columns['usernames'],
+                   columns['texts'])
+        for timestamp, username, text in rows:
+            batch.append(timestamp, username, text)
+        return batch
+
+    @property
+    def buffer(self) -> str:
+        """All the texts back to back"""
+        if self._texts:
+            self._buffer += ''.join(self._texts)
+            self._texts = []
+        return self._buffer
+
+    def __getstate__(self):
+        return (self.timestamps, self.usernames, self.text_ends,
+                self.strings, self.buffer)
+
+    def __setstate__(self, state):
+        self.timestamps, self.usernames, self.text_ends, self.strings, \
+            self._buffer = state
+        self._texts = []
+        self._string_ids = {string: string_id for string_id, string
+                            in enumerate(self.strings)}
+
+    def _intern(self, string: Optional[str]) -> int:
+        if string is None:
+            return -1
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = self._string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def _string(self, string_id: int) -> Optional[str]:
+        return self.strings[string_id] if string_id >= 0 else None
+
+
+class MessageView:
+    """One message of a batch, read like the Message namedtuple"""
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch: MessageBatch, index: int):
+        self.batch = batch
+        self.index = index
+
+    @property
+    def text(self) -> str:
+        return self.batch.text(self.index)
+
+    @property
+    def timestamp(self) -> int:
+        return self.batch.timestamps[self.index]
+
+    @property
+    def date(self) -> datetime:
+        return to_datetime(self.timestamp)
+
+    @property
+    def username(self) -> Optional[str]:
+        return self.batch.username(self.index)
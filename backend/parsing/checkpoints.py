@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+from typing import Dict
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.site_parser',
+                            'checkpoints.sqlite3')
+
+
+# `newest_message` is a POSIX timestamp, 0 when no message was kept yet
+ThreadCheckpoint = namedtuple('ThreadCheckpoint',
+                              ('last_page_url', 'newest_message'))
+
+
+class CheckpointStore:
+    """Remembers the threads crawled for every site and search term
+
+    For each thread it keeps the URL of the last page fetched and the time
+    of the newest message taken from it, so later crawls can skip known
+    threads and only read the pages added to their end.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def threads(self, site: str,
+                search_request: str) -> Dict[str, ThreadCheckpoint]:
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT thread_url, last_page_url, newest_message '
+                'FROM threads WHERE site = ? AND search_request = ?',
+                (site, search_request)
+            ).fetchall()
+        return {thread_url: ThreadCheckpoint(last_page_url, newest_message)
+                for thread_url, last_page_url, newest_message in rows}
+
+    def record(self, site: str, search_request: str, thread_url: str,
+               last_page_url: str, newest_message: float = 0):
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO threads (site, search_request, thread_url, '
+                'last_page_url, newest_message) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (site, search_request, thread_url) DO UPDATE '
+                'SET last_page_url = excluded.last_page_url, '
+                'newest_message = MAX(newest_message, '
+                'excluded.newest_message)',
+                (site, search_request, thread_url, last_page_url,
+                 newest_message)
+            )
+            self._db.commit()
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS threads ('
+                'site TEXT, search_request TEXT, thread_url TEXT, '
+                'last_page_url TEXT, newest_message REAL DEFAULT 0, '
+                'PRIMARY KEY (site, search_request, thread_url))'
+            )
+            self._connection = connection
+        return self._connection
+
+
+checkpoint_store = CheckpointStore()
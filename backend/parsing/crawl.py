@@ -1,28 +1,30 @@
 import re
-import requests
-from urllib.parse import urlencode
+from html import unescape
+from urllib.parse import urljoin, urlsplit
 import asyncio
+import aiohttp
+import contextlib
+from functools import partial
 from collections import namedtuple
 from bs4 import BeautifulSoup
 from parsing.session_managers import (
     SessionManager, BHFSessionManager, LolzSessionManager
 )
 from parsing.scrape import MessageScraper, BHFScraper, LolzScraper, Message
-from parsing.exceptions import NoSearchResultsException
-from utils.patching.patch_search_engine_scraper import (
-    patch_serve_search_engines
+from parsing.memo import PageMemo
+from parsing.page_budget import read_page
+from parsing.serp import (
+    BingSearch, FederatedSearch, GoogleSearch, SearchEngine
 )
-from utils.context import no_print
+from parsing.exceptions import NoSearchResultsException
+from utils.http_client import async_client
 
-from typing import Iterable, List, Iterator
+from typing import (
+    AsyncIterator, Awaitable, Callable, Collection, Iterable, List, Iterator,
+    Optional
+)
 from bs4.element import Tag
 
-patch_serve_search_engines()
-with no_print():
-    from search_engine_scraper import (
-        bing, serve_search_engines, PROXY_USAGE_TIMEOUT
-    )
-
 
 Page = namedtuple('Page', ('link', 'html'))
 
@@ -35,9 +37,16 @@ class Crawler:
         self.session_manager = session_manager
         self.scraper = scraper
         self.main_page_link = main_page_link
+        self.memo = PageMemo()
+
+    NEXT_PAGE_PATTERN = re.compile(r'<link rel="next" href="([^"]+)"')
 
     def search(self, search_request: str, *,
-               one_page_only) -> Iterable[Page]:
+               one_page_only, max_pages,
+               skip: Collection[str] = ()) -> Iterable[Page]:
+        """Yield the pages of threads matching the request, except
+        the ones in `skip`
+        """
         raise NotImplementedError
 
     def get_messages(self,
@@ -45,6 +54,37 @@ class Crawler:
                      search_request: str) -> Iterable[Message]:
         return self.scraper.get_messages(page_html, search_request)
 
+    def get_thread_pages(self, url: str,
+                         revalidate: bool = False) -> Iterator[Page]:
+        """Yield the thread page at `url` and every page after it
+
+        `revalidate` skips cached copies the site has changed since, as
+        the pages of a thread read before do when posts are added.
+        """
+        fetch = partial(self.session_manager.get_page, revalidate=revalidate)
+        while url:
+            html = self.memo.get_page(url, fetch)
+            if html == '':
+                return
+            if html is None:
+                # Already scraped for another term, which noted where the
+                # thread goes on unless a search fetched the page
+                next_url = self.memo.next_page(
+                    url, lambda: self._next_page_url(url, fetch(url))
+                )
+            else:
+                # Noted before the page is handed over and its content
+                # dropped
+                next_url = self._next_page_url(url, html)
+                self.memo.note_next_page(url, next_url)
+            yield Page(url, html)
+            url = next_url
+
+    def _next_page_url(self, url: str, html) -> Optional[str]:
+        next_page = self.NEXT_PAGE_PATTERN.search(read_page(html))
+        return urljoin(url, unescape(next_page.group(1))) \
+            if next_page else None
+
     def _get_result_pages(self, html_page: Tag, one_page_only: bool = False):
         yield html_page
         if not one_page_only:
@@ -56,6 +96,9 @@ class Crawler:
 
 
 class AsyncCrawler(Crawler):
+    FETCH_WORKERS = 16
+    QUEUE_SIZE = 32
+
     def __init__(self,
                  session_manager: SessionManager = None,
                  scraper: MessageScraper = None,
@@ -63,129 +106,129 @@ class AsyncCrawler(Crawler):
         super().__init__(session_manager, scraper, main_page_link)
 
     def search(self, search_request: str, *,
-               one_page_only, max_pages) -> List[Page]:
-        pages = []
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(
-            self._search_async(search_request,
-                               pages,
-                               one_page_only,
-                               max_pages)
+               one_page_only, max_pages,
+               skip: Collection[str] = ()) -> Iterator[Page]:
+        """Yield pages as soon as they are fetched"""
+        return async_client.iterate(
+            self._search_async(search_request, one_page_only, max_pages,
+                               skip)
         )
-        return pages
 
-    async def _search_async(self,
-                            search_request: str,
-                            pages: List[Page],
-                            one_page_only: bool,
-                            max_pages: int):
+    def _search_async(self,
+                      search_request: str,
+                      one_page_only: bool,
+                      max_pages: int,
+                      skip: Collection[str]) -> AsyncIterator[Page]:
         raise NotImplementedError
 
-
-class GoogleCrawler(Crawler):
-    MAX_RESULTS = 1_000_000
-    RESULTS_PER_PAGE = 10
-
-    @classmethod
-    def get_results(cls, search_request: str, one_page_only):
-        url_data = {
-            'hl': 'en',
-            'q': f'"{search_request}"'
-        }
-        session_manager = SessionManager()
-
-        if one_page_only:
-            url_data.update({'start': 0})
-            yield from cls._get_links(url_data, session_manager)
-        else:
-            for result_counter in range(0, cls.MAX_RESULTS,
-                                        cls.RESULTS_PER_PAGE):
-                url_data.update({'start': result_counter})
-                yield from cls._get_links(url_data, session_manager)
-
-    @staticmethod
-    def _get_links(url_data, session_manager):
-        url = f'https://google.com/search?{urlencode(url_data)}+site%3Alolz.guru'   # noqa: E501
-        google_html = session_manager.get_page(url)
-        google_page = BeautifulSoup(google_html, 'html.parser')
-        return (res.find('a')['href'] for res in
-                google_page.find_all('div', {'class': 'r'}))
-
-
-class BingCrawler(Crawler):
-    MAX_PAGES_TO_CRAWL = 100
-    server = serve_search_engines()
-
-    @classmethod
-    def get_results(cls, search_request: str, one_page_only, max_pages):
-        with no_print():
-            engine = cls.Engine(cls.server)
-            return engine.search(search_request, one_page_only, max_pages)
-
-    class Engine(bing):
-        def search(self, query: str, one_page_only: bool, max_pages: int):
-            """
-            Queries the search_engine for the specified query
-            """
-            url = self.text_query_encoding(query)
-            page = self.serve_engine.get_page(url)
-            yield from self._get_links(page)
-            if not one_page_only:
-                page_num = 1
-                while page_num <= max_pages:
-                    url = self._get_next_page_url(page)
-                    if not url:
-                        break
-                    yield from self._get_links(page)
-                    page = self.serve_engine.get_page(url)
-                    page_num += 1
-
-        def _get_links(self, page: requests.Response):
-            links = self.text_result_parsing(page)
-            if not links:
-                self.change_proxies()
-                links = self.text_result_parsing(page)
-            return links
-
-        def _get_next_page_url(self, page_resp: requests.Response):
-            if page_resp is None:
-                return ''
-            page_str = page_resp.content.decode(page_resp.encoding)
-            page_html = BeautifulSoup(page_str, 'html.parser')
-            a = page_html.find('a', {'class': 'sb_pagN'})
-            if a is None:
-                return ''
-            if 'sb_inactP' not in a['class']:
-                return 'https://www.bing.com' + a['href']
-            else:
-                return ''
-
-        def change_proxies(self):
-            self.time_difference = PROXY_USAGE_TIMEOUT
-            self.serve_engine.proxy_check()
+    async def _fetch_pages(
+            self, queue_links: Callable[[asyncio.Queue], Awaitable],
+            aiosession) -> AsyncIterator[Page]:
+        """Pipeline finding thread links, fetching them and the consumer
+
+        `queue_links` puts thread links on the queue it is given while a
+        fixed number of workers fetch them, and fetched pages are yielded
+        right away. Both queues are bounded, so a slow consumer pauses the
+        fetching.
+        """
+        thread_links = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        pages = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        producer = asyncio.ensure_future(
+            self._produce(queue_links, thread_links)
+        )
+        fetchers = [
+            asyncio.ensure_future(
+                self._fetch_threads(thread_links, pages, aiosession)
+            )
+            for _ in range(self.FETCH_WORKERS)
+        ]
+        try:
+            fetchers_left = len(fetchers)
+            while fetchers_left:
+                page = await pages.get()
+                if page is None:
+                    fetchers_left -= 1
+                    continue
+                yield page
+            await asyncio.gather(*fetchers)
+            await producer
+        finally:
+            for task in (producer, *fetchers):
+                task.cancel()
+
+    async def _produce(self, queue_links: Callable[[asyncio.Queue], Awaitable],
+                       thread_links: asyncio.Queue):
+        """Queue the thread links, then one stop mark per fetcher
+
+        A failed or cancelled producer drops the links not taken yet and
+        queues the stop marks without waiting, as the fetchers may be gone.
+        """
+        try:
+            await queue_links(thread_links)
+        except BaseException:
+            while not thread_links.empty():
+                thread_links.get_nowait()
+            with contextlib.suppress(asyncio.QueueFull):
+                for _ in range(self.FETCH_WORKERS):
+                    thread_links.put_nowait(None)
+            raise
+        for _ in range(self.FETCH_WORKERS):
+            await thread_links.put(None)
+
+    async def _fetch_threads(self, thread_links: asyncio.Queue,
+                             pages: asyncio.Queue, aiosession):
+        try:
+            while (url := await thread_links.get()) is not None:
+                try:
+                    url, html = await self.memo.afetch(
+                        url, partial(self.session_manager.afetch,
+                                     url, aiosession)
+                    )
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    print(f'Failed to fetch thread {url}')
+                    continue
+                await pages.put(Page(url, html))
+        except asyncio.CancelledError:
+            # Only a consumer that stopped reading cancels the fetchers, so
+            # the queue may stay full
+            with contextlib.suppress(asyncio.QueueFull):
+                pages.put_nowait(None)
+            raise
+        except BaseException:
+            await pages.put(None)
+            raise
+        await pages.put(None)
 
 
 class BHFCrawler(AsyncCrawler):
+    THREAD_LINK_PATTERN = re.compile(r"^/thread")
+    PAGE_PARAM_PATTERN = re.compile(r"page=\d+")
+
     def __init__(self, *,
                  session_manager: SessionManager = None,
                  scraper: MessageScraper = None,
-                 main_page_link: str = "https://bhf.io"):
+                 main_page_link: str = "https://bhf.io",
+                 use_cache: bool = True):
         if not session_manager:
-            session_manager = BHFSessionManager(main_page_link)
+            session_manager = BHFSessionManager(main_page_link, use_cache)
         if not scraper:
             scraper = BHFScraper()
         super().__init__(session_manager, scraper, main_page_link)
 
     async def _search_async(self,
                             search_request: str,
-                            pages: List[Page],
                             one_page_only: bool,
-                            max_pages: int):
-        search_results_response = self.session_manager.\
-            request_search(search_request)
-        search_results = BeautifulSoup(
-            search_results_response.content.decode("utf-8"), 'html.parser'
+                            max_pages: int,
+                            skip: Collection[str]) -> AsyncIterator[Page]:
+        """Fetch the threads of every result page as the pages arrive"""
+        # Blocking calls go to the executor to keep the shared loop free
+        loop = asyncio.get_event_loop()
+        search_results_response = await loop.run_in_executor(
+            None, self.session_manager.request_search, search_request
+        )
+        search_results = await loop.run_in_executor(
+            None, self._parse_html,
+            search_results_response.content.decode("utf-8")
         )
         main_content = search_results\
             .find('div', {'uix_component': 'MainContent'})
@@ -195,63 +238,131 @@ class BHFCrawler(AsyncCrawler):
                 f'Search term "{search_request}": nothing found'
             )
 
-        thread_links = self._get_thread_links(
-            search_results, one_page_only, max_pages
-        )
-        threads = await self.session_manager.fetch(thread_links)
-        pages.extend(Page(url, html) for url, html in threads)
+        aiosession = await async_client.session()
+        paginate = partial(self._paginate, search_results, one_page_only,
+                           max_pages, aiosession=aiosession, skip=skip)
+        async for page in self._fetch_pages(paginate, aiosession):
+            yield page
+
+    async def _paginate(self, first_page: Tag, one_page_only: bool,
+                        max_pages: int, thread_links: asyncio.Queue,
+                        aiosession, skip: Collection[str] = ()):
+        """Queue the thread links of every result page"""
+        seen_links = set(skip)
+
+        async def queue_links(result_page: Tag):
+            for link in self._get_thread_links(result_page):
+                if link not in seen_links:
+                    seen_links.add(link)
+                    await thread_links.put(link)
+
+        await queue_links(first_page)
+        if one_page_only:
+            return
+
+        page_urls = self._get_result_page_urls(first_page, max_pages)
+        if page_urls:
+            result_pages = [self._get_result_page(url, aiosession)
+                            for url in page_urls]
+            for result_page in asyncio.as_completed(result_pages):
+                await queue_links(await result_page)
+            return
+
+        # No page navigation to read the page count from,
+        # so follow the "next" links one by one
+        result_page, page_num = first_page, 1
+        while page_num < max_pages:
+            relative_url = self._get_next_page_url(result_page)
+            if not relative_url:
+                break
+            result_page = await self._get_result_page(
+                self.main_page_link + relative_url, aiosession
+            )
+            await queue_links(result_page)
+            page_num += 1
 
-    def _get_thread_links(self, html_page: Tag, one_page_only: bool,
-                          max_pages):
+    async def _get_result_page(self, url: str, aiosession) -> Tag:
+        _, html = await self.session_manager.afetch(url, aiosession)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._parse_html, html)
+
+    def _get_thread_links(self, html_page: Tag) -> List[str]:
         """Get links for threads listed on html page"""
-        for page in self._get_result_pages(html_page, one_page_only,
-                                           max_pages):
-            yield from (
-                f"https://bhf.io{link['href']}" for link in
-                html_page.find_all("a", {"href": re.compile(r"^/thread")})
+        return [
+            f"{self.main_page_link}{link['href']}" for link in
+            html_page.find_all("a", {"href": self.THREAD_LINK_PATTERN})
+        ]
+
+    def _get_result_page_urls(self, html_page: Tag,
+                              max_pages: int) -> List[str]:
+        """Build the URLs of result pages 2 to `max_pages` from the page
+        navigation, so they can be fetched at once
+        """
+        relative_url = self._get_next_page_url(html_page)
+        page_links = html_page.select("ul.pageNav-main li.pageNav-page a")
+        if not relative_url or not page_links:
+            return []
+        try:
+            last_page = int(page_links[-1].get_text(strip=True))
+        except ValueError:
+            return []
+        return [
+            self.main_page_link + self.PAGE_PARAM_PATTERN.sub(
+                f'page={page_num}', relative_url
             )
-
-    def _get_result_pages(self, html_page: Tag,
-                          one_page_only: bool, max_pages: int) -> Tag:
-        yield html_page
-        if not one_page_only:
-            page_num = 1
-            while page_num <= max_pages:
-                relative_url = self._get_next_page_url(html_page)
-                if not relative_url:
-                    break
-                next_page_url = self.main_page_link + relative_url
-                html = self.session_manager.get_page(next_page_url)
-                yield BeautifulSoup(html, 'html.parser')
+            for page_num in range(2, min(last_page, max_pages) + 1)
+        ]
 
     def _get_next_page_url(self, html_page: Tag):
         link_html = html_page.find("link", {"rel": "next"})
-        return link_html['href']
+        return link_html['href'] if link_html else None
 
+    @staticmethod
+    def _parse_html(content) -> Tag:
+        return BeautifulSoup(content, 'html.parser')
 
-class LolzCrawler(Crawler):
+
+class LolzCrawler(AsyncCrawler):
     SEARCH_PREFIX = 'site:lolz.guru'
+    FETCH_WORKERS = 8
 
     def __init__(self, *,
                  session_manager: SessionManager = None,
                  scraper: MessageScraper = None,
-                 main_page_link: str = "https://lolz.guru"):
+                 main_page_link: str = "https://lolz.guru",
+                 use_cache: bool = True,
+                 search_engine: SearchEngine = None):
         if not session_manager:
-            session_manager = LolzSessionManager(main_page_link)
+            session_manager = LolzSessionManager(main_page_link, use_cache)
         if not scraper:
             scraper = LolzScraper()
         super().__init__(session_manager, scraper, main_page_link)
+        if not search_engine:
+            search_engine = FederatedSearch([BingSearch(), GoogleSearch()])
+        self.search_engine = search_engine
 
-    def search(self, search_request: str, *,
-               one_page_only,
-               max_pages) -> Iterator[Page]:
-        for url in BingCrawler.get_results(
-                f'{self.SEARCH_PREFIX} {search_request}',
-                one_page_only=one_page_only,
-                max_pages=max_pages):
-            if 'forums' in url:
-                continue
-            html = self.session_manager.get_page(url)
-            if not html:
-                return
-            yield Page(url, html)
+    async def _search_async(self,
+                            search_request: str,
+                            one_page_only: bool,
+                            max_pages: int,
+                            skip: Collection[str]) -> AsyncIterator[Page]:
+        """Fetch the threads the search engines find while they page
+        through their results
+        """
+        async def queue_links(thread_links: asyncio.Queue):
+            seen_links = set(skip)
+            async for url in self.search_engine.search(
+                    f'{self.SEARCH_PREFIX} {search_request}',
+                    one_page_only, max_pages):
+                if self._is_thread_link(url) and url not in seen_links:
+                    seen_links.add(url)
+                    await thread_links.put(url)
+
+        aiosession = await async_client.session()
+        async for page in self._fetch_pages(queue_links, aiosession):
+            yield page
+
+    def _is_thread_link(self, url: str) -> bool:
+        # Results also link to the engine's own pages and to forum indexes
+        return urlsplit(url).netloc == urlsplit(self.main_page_link).netloc \
+            and 'forums' not in url
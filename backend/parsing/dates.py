@@ -0,0 +1,93 @@
+import re
+import calendar
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+
+# Both forums show times in Moscow time
+SITE_TIMEZONE = timezone(timedelta(hours=3))
+
+ISO_PATTERN = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d)(?::(\d\d))?'
+    r'(?:(Z)|([+-])(\d\d):?(\d\d))?'
+)
+DATE_PATTERN = re.compile(r'^(\d{4})-(\d\d)-(\d\d)$')
+# 12 авг 2020 в 17:41
+RUSSIAN_PATTERN = re.compile(
+    r'(\d{1,2})\s+([а-яё]+)\.?\s+(\d{4})(?:\s+в)?\s+(\d{1,2}):(\d\d)',
+    re.IGNORECASE
+)
+RUSSIAN_MONTHS = {
+    'янв': 1, 'фев': 2, 'мар': 3, 'апр': 4, 'май': 5, 'мая': 5, 'июн': 6,
+    'июл': 7, 'авг': 8, 'сен': 9, 'окт': 10, 'ноя': 11, 'дек': 12,
+}
+
+
+def _epoch(year: int, month: int, day: int, hour: int, minute: int,
+           second: int, offset: int) -> int:
+    return calendar.timegm((year, month, day, hour, minute, second)) - offset
+
+
+def parse_iso(text: str) -> int:
+    """Epoch seconds of an ISO 8601 date, taken as site time if it has no
+    offset
+    """
+    match = ISO_PATTERN.search(text)
+    if not match:
+        raise ValueError(f'Not an ISO date: "{text}"')
+    year, month, day, hour, minute, second, utc, sign, offset_hours, \
+        offset_minutes = match.groups()
+    if utc:
+        offset = 0
+    elif sign:
+        offset = int(offset_hours) * 3600 + int(offset_minutes) * 60
+        if sign == '-':
+            offset = -offset
+    else:
+        offset = _site_offset()
+    return _epoch(int(year), int(month), int(day), int(hour), int(minute),
+                  int(second or 0), offset)
+
+
+def parse_russian(text: str) -> int:
+    """Epoch seconds of a date like "12 авг 2020 в 17:41" in site time
+
+    Month names are read from a fixed table, not the process locale.
+    """
+    match = RUSSIAN_PATTERN.search(text)
+    if not match:
+        raise ValueError(f'Not a date: "{text}"')
+    day, month_name, year, hour, minute = match.groups()
+    month = RUSSIAN_MONTHS.get(month_name[:3].lower())
+    if month is None:
+        raise ValueError(f'Unknown month "{month_name}"')
+    return _epoch(int(year), month, int(day), int(hour), int(minute), 0,
+                  _site_offset())
+
+
+def parse_query_date(text: str) -> int:
+    """Epoch seconds of a date given in a query: epoch seconds, a day,
+    taken as its midnight in site time, or an ISO 8601 time
+    """
+    text = str(text).strip()
+    if text.isdigit():
+        return int(text)
+    match = DATE_PATTERN.match(text)
+    if match:
+        year, month, day = map(int, match.groups())
+        return _epoch(year, month, day, 0, 0, 0, _site_offset())
+    return parse_iso(text)
+
+
+def to_datetime(timestamp: int) -> datetime:
+    return datetime.fromtimestamp(timestamp, SITE_TIMEZONE)
+
+
+@lru_cache(maxsize=4096)
+def format_timestamp(timestamp: int, date_format: str) -> str:
+    # Messages of a page are often minutes apart, so formats repeat a lot
+    return to_datetime(timestamp).strftime(date_format)
+
+
+def _site_offset() -> int:
+    return int(SITE_TIMEZONE.utcoffset(None).total_seconds())
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import socket
+import threading
+import multiprocessing
+from uuid import uuid4
+from parsing.sinks import open_sink
+
+from typing import Iterable, Type
+from parsing.crawl import Crawler
+from parsing.parse import crawl_terms
+from parsing.batch import MessageBatch
+from parsing.progress import Progress
+from parsing.exceptions import JobCancelledException, NoWorkersException
+from utils.broker import Broker, SQLiteBroker, Task, TaskStatus, broker
+from utils import metrics
+
+
+POLL_INTERVAL = 1.0     # seconds
+# How long a job waits for any worker to take one of its tasks
+WORKER_TIMEOUT = 60     # seconds
+# Crawlers a task may name, so a payload cannot run arbitrary code
+CRAWLERS = ('BHFCrawler', 'LolzCrawler')
+
+
+def parse_messages_distributed(crawler_class: Type[Crawler],
+                               search_requests: Iterable[str],
+                               workbook_path: str,
+                               search_one_page_only: bool,
+                               max_pages: int,
+                               progress: Progress = None,
+                               use_cache: bool = True,
+                               parse_workers: int = 0,
+                               incremental: bool = False,
+                               export_format: str = 'xlsx',
+                               local_workers: int = 0,
+                               task_broker: Broker = None,
+                               page_memory_mb: int = 0,
+                               spill_pages: bool = False,
+                               index_messages: bool = False) -> dict:
+    """parse_messages, with each search request crawled as a task by
+    worker processes, here or on other machines
+
+    The results are merged into the file once every task is finished. The
+    job fails with NoWorkersException if no worker takes any of its tasks
+    within WORKER_TIMEOUT seconds.
+    Returns the page stats summed over the tasks and the errors of the
+    search requests that could not be crawled. With `index_messages`,
+    workers add the messages they scrape to the message index of their
+    machine.
+    """
+    if progress is None:
+        progress = Progress()
+    if task_broker is None:
+        task_broker = broker
+    if crawler_class.__name__ not in CRAWLERS:
+        raise ValueError(f'{crawler_class.__name__} cannot run distributed')
+    search_requests = list(search_requests)
+    progress.set(terms_total=len(search_requests))
+
+    job_id = uuid4().hex
+    task_broker.put(job_id, [
+        {
+            'crawler': crawler_class.__name__,
+            'search_request': search_request,
+            'one_page_only': search_one_page_only,
+            'max_pages': max_pages,
+            'use_cache': use_cache,
+            'parse_workers': parse_workers,
+            'incremental': incremental,
+            'page_memory_mb': page_memory_mb,
+            'spill_pages': spill_pages,
+            'index_messages': index_messages,
+        }
+        for search_request in search_requests
+    ])
+    # Spawned, as a fork would inherit the async client's dead loop
+    spawn = multiprocessing.get_context('spawn')
+    workers = [
+        spawn.Process(target=work_until_idle, args=(task_broker.path,),
+                      daemon=True)
+        for _ in range(local_workers)
+    ] if isinstance(task_broker, SQLiteBroker) else []
+    for worker in workers:
+        worker.start()
+
+    try:
+        _wait(task_broker, job_id, progress)
+        stats = {'requested_urls': 0, 'unique_urls': 0}
+        with open_sink(workbook_path, export_format) as workbook:
+            for position, result in task_broker.results(job_id):
+                # JSON, as workers elsewhere write the file too
+                result = json.loads(result)
+                for name in stats:
+                    stats[name] += result['stats'][name]
+                if not result['pages']:
+                    continue
+                progress.add(pages_fetched=len(result['pages']))
+                sheet = workbook.create_sheet(search_requests[position],
+                                              position)
+                for page in result['pages']:
+                    rows_written = sheet.write_messages(
+                        MessageBatch.from_dict(page['messages']),
+                        page['link']
+                    )
+                    progress.add(messages_written=rows_written)
+                    metrics.rows_written.labels(format=export_format)\
+                        .inc(rows_written)
+        stats['failed_terms'] = {
+            search_requests[position]: error
+            for position, error in task_broker.errors(job_id).items()
+        }
+        return stats
+    finally:
+        task_broker.forget(job_id)
+        for worker in workers:
+            worker.join(timeout=POLL_INTERVAL)
+
+
+def _wait(task_broker: Broker, job_id: str, progress: Progress):
+    gives_up_at = time.monotonic() + WORKER_TIMEOUT
+    taken = False
+    while True:
+        counts = task_broker.counts(job_id)
+        finished = sum(counts[status] for status in TaskStatus.FINISHED)
+        progress.set(terms_done=finished)
+        if not counts[TaskStatus.PENDING] and not counts[TaskStatus.LEASED]:
+            return
+        if progress.cancelled:
+            task_broker.cancel(job_id)
+            progress.check_cancelled()
+        taken = taken or counts[TaskStatus.LEASED] or finished
+        if not taken and time.monotonic() > gives_up_at:
+            task_broker.cancel(job_id)
+            raise NoWorkersException(
+                f'No worker took a task in {WORKER_TIMEOUT} seconds; start '
+                f'workers with worker.py or set local_workers'
+            )
+        time.sleep(POLL_INTERVAL)
+
+
+def work(task_broker: Broker, worker: str = None,
+         stop_when_idle: bool = False):
+    """Run tasks from the broker, forever or until there are none left"""
+    if worker is None:
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+    while True:
+        task = task_broker.lease(worker)
+        if task is None:
+            if stop_when_idle:
+                return
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        progress = Progress()
+        renewing = threading.Thread(
+            target=_renew_lease, args=(task_broker, task, worker, progress),
+            name='lease', daemon=True
+        )
+        renewing.start()
+        try:
+            result = run_task(task, progress)
+        except JobCancelledException:
+            # Cancelled, or taken over by another worker: nothing to store
+            continue
+        except Exception as e:
+            task_broker.fail(task.id, worker, f'{type(e).__name__}: {e}')
+            continue
+        finally:
+            progress.cancel()
+            renewing.join()
+        task_broker.complete(task.id, worker, result)
+
+
+def work_until_idle(broker_path: str):
+    work(SQLiteBroker(broker_path), stop_when_idle=True)
+
+
+def run_task(task: Task, progress: Progress) -> bytes:
+    """Crawl a task's search request; the pages found and the page stats,
+    as JSON
+    """
+    from parsing import crawl
+    from parsing.message_index import message_index
+    payload = task.payload
+    if payload['crawler'] not in CRAWLERS:
+        raise ValueError(f'Unknown crawler "{payload["crawler"]}"')
+    crawler = getattr(crawl, payload['crawler'])(
+        use_cache=payload['use_cache']
+    )
+    with crawl_terms(crawler, [payload['search_request']],
+                     payload['one_page_only'], payload['max_pages'],
+                     progress, parse_workers=payload['parse_workers'],
+                     incremental=payload['incremental'],
+                     page_memory_mb=payload['page_memory_mb'],
+                     spill_pages=payload['spill_pages'],
+                     message_index=message_index
+                     if payload['index_messages'] else None) as term_pages:
+        pages = [{'link': term_page.page.link,
+                  'messages': term_page.messages.as_dict()}
+                 for term_page in term_pages if term_page.page is not None]
+    return json.dumps({'pages': pages, 'stats': crawler.memo.stats()},
+                      ensure_ascii=False).encode()
+
+
+def _renew_lease(task_broker: Broker, task: Task, worker: str,
+                 progress: Progress):
+    # Renewing fails once the job is cancelled or the lease was lost,
+    # and cancelling the progress then stops the crawl
+    while not progress.wait_cancelled(task_broker.lease_time / 3):
+        if not task_broker.renew(task.id, worker):
+            progress.cancel()
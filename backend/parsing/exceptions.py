@@ -4,3 +4,11 @@ class NoSearchResultsException(Exception):
 
 class ServerIsDownException(Exception):
     pass
+
+
+class JobCancelledException(Exception):
+    pass
+
+
+class NoWorkersException(Exception):
+    pass
@@ -1,12 +1,58 @@
 import contextlib
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+
+from parsing.batch import MessageBatch
+from parsing.dates import format_timestamp
+from utils import metrics
+
+
+class ExcelSheet:
+    """Appends rows to a write-only worksheet as they arrive"""
+    DATE_FORMAT = "%Y/%m/%d  %H:%M"
+
+    def __init__(self, worksheet: WriteOnlyWorksheet):
+        self.worksheet = worksheet
+
+    def write_messages(self, messages: MessageBatch, link: str) -> int:
+        rows_written = 0
+        for index, text in enumerate(messages.texts()):
+            date_cell = WriteOnlyCell(self.worksheet, format_timestamp(
+                messages.timestamps[index], self.DATE_FORMAT
+            ))
+            username_cell = WriteOnlyCell(self.worksheet,
+                                          messages.username(index))
+            username_cell.style = "Hyperlink"
+            username_cell.hyperlink = link
+            text_cell = WriteOnlyCell(self.worksheet, text)
+
+            self.worksheet.append((date_cell, username_cell, text_cell))
+            rows_written += 1
+        return rows_written
+
+
+class ExcelDocument:
+    def __init__(self, workbook: Workbook):
+        self.workbook = workbook
+
+    def create_sheet(self, title: str, index: int = None) -> ExcelSheet:
+        return ExcelSheet(self.workbook.create_sheet(title, index))
 
 
 @contextlib.contextmanager
 def excel_document(name: str):
+    """Stream a workbook to `name`
+
+    Rows are flushed to temporary files as they are appended, so memory use
+    does not grow with the number of rows written.
+    """
+    workbook = Workbook(write_only=True)
     try:
-        workbook = Workbook()
-        yield workbook
+        yield ExcelDocument(workbook)
     finally:
-        workbook.save(name)
+        if not workbook.worksheets:
+            workbook.create_sheet()
+        with metrics.save_seconds.labels(format='xlsx').time():
+            workbook.save(name)
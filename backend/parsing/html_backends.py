@@ -0,0 +1,206 @@
+import re
+from html import escape
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+from typing import Iterable, List, Optional
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+
+class HTMLBackend:
+    """Tree queries the message scrapers are written against
+
+    `text` must return the same string as serializing the subtree with
+    BeautifulSoup and joining its stripped text nodes with spaces, so every
+    backend yields identical messages.
+    """
+    name = None
+
+    def parse(self, content):
+        raise NotImplementedError
+
+    def find_all(self, node, tag: str, class_name: str = None) -> List:
+        raise NotImplementedError
+
+    def find(self, node, tag: str, class_name: str = None,
+             class_prefix: bool = False):
+        raise NotImplementedError
+
+    def attr(self, node, name: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def text(self, node, exclude: Iterable[str] = ()) -> str:
+        raise NotImplementedError
+
+    def full_text(self, node) -> str:
+        raise NotImplementedError
+
+    def string(self, node) -> Optional[str]:
+        raise NotImplementedError
+
+
+class SoupBackend(HTMLBackend):
+    """Pure-Python fallback built on BeautifulSoup's html.parser"""
+    name = 'html.parser'
+    OMIT_HTML_PATTERN = re.compile(r"(?<=>)[^<]+")
+
+    def parse(self, content) -> Tag:
+        return BeautifulSoup(content, "html.parser")
+
+    def find_all(self, node: Tag, tag: str, class_name: str = None):
+        return node.findAll(tag, self._attrs(class_name))
+
+    def find(self, node: Tag, tag: str, class_name: str = None,
+             class_prefix: bool = False):
+        if class_prefix:
+            return node.find(tag, {"class": re.compile(f"^{class_name}")})
+        return node.find(tag, self._attrs(class_name))
+
+    def attr(self, node: Tag, name: str):
+        return node.get(name)
+
+    def text(self, node: Tag, exclude: Iterable[str] = ()) -> str:
+        exclude = list(exclude)
+        if exclude:
+            for excluded in node.findAll(exclude):
+                excluded.extract()
+        matches = self.OMIT_HTML_PATTERN.finditer(str(node))
+        return " ".join(match.group(0).strip() for match in matches)
+
+    def full_text(self, node: Tag) -> str:
+        return node.text
+
+    def string(self, node: Tag):
+        string = node.string
+        return None if string is None else str(string)
+
+    @staticmethod
+    def _attrs(class_name: str = None) -> dict:
+        return {"class": class_name} if class_name else {}
+
+
+class LxmlBackend(HTMLBackend):
+    """libxml2-backed backend
+
+    Text is read straight off the message subtrees instead of being
+    re-serialized and matched with a regex.
+    """
+    name = 'lxml'
+    # BeautifulSoup writes the text of these out unescaped
+    RAW_TEXT_TAGS = frozenset(('script', 'style'))
+
+    def __init__(self):
+        self._parser = lxml.html.HTMLParser(encoding='utf-8')
+
+    def parse(self, content):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return lxml.html.document_fromstring(content, parser=self._parser)
+
+    def find_all(self, node, tag: str, class_name: str = None):
+        return node.xpath(self._xpath(tag, class_name))
+
+    def find(self, node, tag: str, class_name: str = None,
+             class_prefix: bool = False):
+        found = node.xpath(self._xpath(tag, class_name, class_prefix))
+        return found[0] if found else None
+
+    def attr(self, node, name: str):
+        return node.get(name)
+
+    def text(self, node, exclude: Iterable[str] = ()) -> str:
+        segments, run = [], []
+        self._collect_text(node, frozenset(exclude), segments, run)
+        return " ".join(segments)
+
+    def full_text(self, node) -> str:
+        return node.text_content()
+
+    def string(self, node):
+        if len(node) == 0:
+            return node.text
+        child = node[0]
+        if len(node) == 1 and not node.text and not child.tail:
+            return self.string(child)
+        return None
+
+    def _collect_text(self, node, exclude: frozenset,
+                      segments: List[str], run: List[str]):
+        # Mirrors SoupBackend.text: text is escaped the way BeautifulSoup
+        # serializes it and every tag boundary ends a segment, while the text
+        # around an excluded subtree stays one segment, just like it does
+        # once the subtree is extracted from the soup
+        self._end_segment(segments, run)
+        if not isinstance(node.tag, str):
+            # A ">" inside a comment starts a segment that runs on into the
+            # comment's tail
+            if node.text and ">" in node.text:
+                run.append(node.text.split(">", 1)[1] + "-->")
+            return
+        if node.tag in self.RAW_TEXT_TAGS:
+            if node.text:
+                self._collect_raw_text(node.text, segments, run)
+        elif node.text:
+            run.append(escape(node.text, quote=False))
+        for child in node:
+            if child.tag not in exclude:
+                self._collect_text(child, exclude, segments, run)
+            if child.tail:
+                run.append(escape(child.tail, quote=False))
+        self._end_segment(segments, run)
+
+    def _collect_raw_text(self, text: str, segments: List[str],
+                          run: List[str]):
+        # Unescaped, a "<" in the text ends a segment and the next ">"
+        # starts one, as they would in markup
+        start = 0
+        while True:
+            end = text.find("<", start)
+            if end == -1:
+                end = len(text)
+            if end > start:
+                run.append(text[start:end])
+            self._end_segment(segments, run)
+            start = text.find(">", end)
+            if start == -1:
+                return
+            start += 1
+
+    @staticmethod
+    def _end_segment(segments: List[str], run: List[str]):
+        if run:
+            segments.append("".join(run).strip())
+            run.clear()
+
+    @staticmethod
+    def _xpath(tag: str, class_name: str = None,
+               class_prefix: bool = False) -> str:
+        if not class_name:
+            return f'.//{tag}'
+        if class_prefix:
+            return (f'.//{tag}[contains(concat(" ", normalize-space(@class)),'
+                    f' " {class_name}")]')
+        return (f'.//{tag}[contains(concat(" ", normalize-space(@class), " "),'
+                f' " {class_name} ")]')
+
+
+BACKENDS = {backend.name: backend for backend in (SoupBackend, LxmlBackend)}
+
+
+def get_backend(name: str = None) -> HTMLBackend:
+    """Instantiate the backend called `name`, the fastest available one
+    by default
+    """
+    if name is None:
+        name = LxmlBackend.name if lxml else SoupBackend.name
+    if name == LxmlBackend.name and not lxml:
+        raise ValueError('lxml backend requires the lxml package')
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f'Unknown HTML backend "{name}"')
@@ -0,0 +1,103 @@
+import unicodedata
+from collections import deque, namedtuple
+
+from typing import Dict, FrozenSet, Iterable, List
+from parsing.batch import MessageBatch
+
+
+class MatchedBatch(namedtuple('MatchedBatch', ('messages', 'terms'))):
+    """A page's messages and, for each, the keywords it has"""
+
+    def found(self, term: str) -> MessageBatch:
+        return self.messages.select(
+            index for index, terms in enumerate(self.terms) if term in terms
+        )
+
+
+# Up to about this many distinct keywords, substring tests on the folded
+# text, which run in C, beat walking the automaton in Python
+SUBSTRING_SEARCH_LIMIT = 200
+
+
+def fold(text: str) -> str:
+    """Caseless form of a text, so that 'Ё', 'ё' and 'ё' compare equal"""
+    return unicodedata.normalize('NFC', text).casefold()
+
+
+class KeywordMatcher:
+    """Finds which of many keywords occur in a text
+
+    Up to SUBSTRING_SEARCH_LIMIT keywords, each case folded keyword is
+    looked for in the case folded text, so the cost grows with the number
+    of keywords. Past that, the keywords are compiled once into an
+    Aho-Corasick automaton, and scanning a text costs about the same
+    whatever their number.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: Dict[str, List[str]] = {}
+        for term in terms:
+            folded = fold(term)
+            if folded:
+                self.terms.setdefault(folded, []).append(term)
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[FrozenSet[str]] = [frozenset()]
+        if len(self.terms) > SUBSTRING_SEARCH_LIMIT:
+            self._build()
+
+    def match(self, text: str) -> FrozenSet[str]:
+        """Original keywords found in the text"""
+        folded = fold(text)
+        if len(self.terms) <= SUBSTRING_SEARCH_LIMIT:
+            found = [term for term in self.terms if term in folded]
+        else:
+            found = self._scan(folded)
+        return frozenset(
+            original for term in found for original in self.terms[term]
+        )
+
+    def match_batch(self, messages: MessageBatch) -> MatchedBatch:
+        return MatchedBatch(messages,
+                            [self.match(text) for text in messages.texts()])
+
+    def _build(self):
+        goto, fail, output = self._goto, self._fail, [set()]
+        for term in self.terms:
+            state = 0
+            for char in term:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    fail.append(0)
+                    output.append(set())
+                state = next_state
+            output[state].add(term)
+
+        states = deque(goto[0].values())
+        while states:
+            state = states.popleft()
+            for char, next_state in goto[state].items():
+                states.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] |= output[fail[next_state]]
+
+        self._output = [frozenset(terms) for terms in output]
+
+    def _scan(self, text: str) -> set:
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
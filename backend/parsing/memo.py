@@ -0,0 +1,157 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from parsing.batch import MessageBatch
+from parsing.matcher import MatchedBatch
+from parsing.page_budget import PageBudget
+
+
+class PageMemo:
+    """Fetches every page of a job once and scrapes it once
+
+    A page's content is kept only until its messages are scraped; later
+    requests for it get None instead, its messages come from `messages`
+    and the next page of its thread from `next_page`. With a budget, the
+    content kept counts against it until then.
+    """
+
+    def __init__(self, budget: PageBudget = None):
+        self.budget = budget
+        self.requested = 0
+        self._pages: Dict[str, Optional[str]] = {}
+        self._fetching: Dict[str, threading.Event] = {}
+        self._afetching: Dict[str, asyncio.Future] = {}
+        self._messages: Dict[str, Future] = {}
+        self._next_pages: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def get_page(self, url: str, fetch: Callable[[str], str]):
+        with self._lock:
+            self.requested += 1
+            fetched = self._fetching.get(url)
+            owner = fetched is None and url not in self._pages
+            if owner:
+                fetched = self._fetching[url] = threading.Event()
+
+        if owner:
+            html = ''
+            try:
+                html = fetch(url)
+                if html and self.budget:
+                    html = self.budget.hold(html)
+                return html
+            finally:
+                with self._lock:
+                    del self._fetching[url]
+                    if html:
+                        self._pages[url] = html
+                fetched.set()
+
+        if fetched:
+            fetched.wait()
+        with self._lock:
+            return self._pages.get(url, '')
+
+    async def afetch(self, url: str,
+                     fetch: Callable[[], Awaitable[Tuple[str, bytes]]]):
+        """Must be awaited on the shared async client's loop"""
+        with self._lock:
+            self.requested += 1
+            fetched = self._afetching.get(url)
+            if fetched is None and url in self._pages:
+                return url, self._pages[url]
+            owner = fetched is None
+            if owner:
+                fetched = self._afetching[url] = \
+                    asyncio.get_event_loop().create_future()
+
+        if not owner:
+            return url, await asyncio.shield(fetched)
+
+        try:
+            _, html = await fetch()
+            if self.budget:
+                html = await self.budget.ahold(html)
+        except BaseException as e:
+            with self._lock:
+                del self._afetching[url]
+            if isinstance(e, asyncio.CancelledError):
+                fetched.cancel()
+            else:
+                fetched.set_exception(e)
+                # Mark it retrieved in case no other term awaits the page
+                fetched.exception()
+            raise
+        with self._lock:
+            del self._afetching[url]
+            self._pages[url] = html
+        fetched.set_result(html)
+        return url, html
+
+    def messages(self, url: str, content,
+                 scrape: Callable[[object], Future]) -> Future:
+        """Future of every message on the page, scraped on the first call"""
+        with self._lock:
+            messages = self._messages.get(url)
+            owner = messages is None
+            if owner:
+                messages = self._messages[url] = Future()
+                if url in self._pages:
+                    self._pages[url] = None
+
+        if owner:
+            if content is None:
+                messages.set_result(MatchedBatch(MessageBatch(), []))
+            else:
+                scraping = scrape(content)
+                if self.budget:
+                    scraping.add_done_callback(
+                        lambda _: self.budget.release(content)
+                    )
+                _chain(scraping, messages)
+        return messages
+
+    def note_next_page(self, url: str, next_url: Optional[str]):
+        """Keep the URL of the page after `url` in its thread, None for the
+        last page
+        """
+        with self._lock:
+            self._next_pages[url] = next_url
+
+    def next_page(self, url: str,
+                  find: Callable[[], Optional[str]]) -> Optional[str]:
+        """The page after `url` in its thread as noted, or as `find` tells
+        for a page nobody noted it for
+        """
+        with self._lock:
+            if url in self._next_pages:
+                return self._next_pages[url]
+        next_url = find()
+        self.note_next_page(url, next_url)
+        return next_url
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requested_urls': self.requested,
+                'unique_urls': len(self._pages),
+            }
+
+
+def _chain(source: Future, target: Future):
+    def copy_result(source: Future):
+        if source.exception():
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+
+    source.add_done_callback(copy_result)
+
+
+def scraped(messages: MatchedBatch) -> Future:
+    """Already completed future of scraped messages"""
+    future = Future()
+    future.set_result(messages)
+    return future
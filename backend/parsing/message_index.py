@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import contextlib
+from itertools import groupby, islice
+from operator import itemgetter
+from parsing.sinks import COLUMNS, open_sink, text_rows
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+from parsing.batch import MessageBatch
+from parsing.matcher import fold
+from parsing.progress import Progress
+from utils import metrics
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.site_parser',
+                            'messages.sqlite3')
+BUSY_TIMEOUT = 30       # seconds
+# The trigram tokenizer cannot look up anything shorter
+MIN_INDEXED_KEYWORD = 3
+# Sheet of an export filtered by author or date only
+EXPORT_SHEET = 'messages'
+
+
+class MessageIndex:
+    """Every message scraped by the crawls, indexed to answer keyword,
+    author and date queries without crawling again
+
+    Messages are added as their pages are scraped, each once however many
+    crawls find it. Keywords match as in a crawl: case folded, anywhere
+    in the text. An SQLite FTS5 trigram index of the case folded texts
+    narrows the messages down to those containing the keyword, so the rows
+    are those a crawl would match. Keywords under three characters, and
+    every keyword where SQLite lacks the trigram tokenizer, scan all the
+    messages passing the other filters instead.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self.full_text = False
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def add(self, site: str, link: str, messages: MessageBatch) -> int:
+        """Index the messages of a page; how many were not indexed yet"""
+        rows = [
+            (site, link, messages.timestamps[index], messages.username(index),
+             text, _message_key(site, messages.timestamps[index],
+                                messages.username(index), text))
+            for index, text in enumerate(messages.texts())
+        ]
+        if not rows:
+            return 0
+        added = 0
+        with self._lock:
+            db = self._open()
+            for row in rows:
+                cursor = db.execute(
+                    'INSERT OR IGNORE INTO messages (site, link, date, '
+                    'username, text, key) VALUES (?, ?, ?, ?, ?, ?)', row
+                )
+                if not cursor.rowcount:
+                    continue
+                added += 1
+                if self.full_text:
+                    db.execute(
+                        'INSERT INTO messages_text (rowid, text) '
+                        'VALUES (?, ?)', (cursor.lastrowid, fold(row[4]))
+                    )
+            db.commit()
+        metrics.messages_indexed.inc(added)
+        return added
+
+    def search(self, term: str = None, since: int = None, until: int = None,
+               username: str = None, site: str = None,
+               limit: int = None) -> Iterator[Tuple[str, MessageBatch]]:
+        """The messages with `term` posted from `since` until before
+        `until`, newest first, as batches of the messages of a link
+
+        Every filter left out matches all messages.
+        """
+        keyword = fold(term) if term else ''
+        tables = 'messages'
+        conditions, params = [], []
+        for condition, value in (('messages.date >= ?', since),
+                                 ('messages.date < ?', until),
+                                 ('messages.username = ?', username),
+                                 ('messages.site = ?', site)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        with self._lock:
+            self._open()
+        if len(keyword) >= MIN_INDEXED_KEYWORD and self.full_text:
+            tables += ' JOIN messages_text ON messages_text.rowid = ' \
+                      'messages.id'
+            conditions.append('messages_text MATCH ?')
+            params.append('"' + keyword.replace('"', '""') + '"')
+        query = 'SELECT messages.link, messages.date, messages.username, ' \
+                f'messages.text FROM {tables}'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY messages.date DESC, messages.id'
+
+        # A connection of its own, so writers are not held up by the reads
+        with contextlib.closing(self._connect()) as db:
+            rows = db.execute(query, params)
+            if keyword:
+                rows = (row for row in rows if keyword in fold(row[3]))
+            if limit is not None:
+                rows = islice(rows, limit)
+            for link, link_rows in groupby(rows, key=itemgetter(0)):
+                messages = MessageBatch()
+                for _, date, username, text in link_rows:
+                    messages.append(date, username, text)
+                yield link, messages
+
+    def find(self, search_requests: Iterable[str], limit: int,
+             **filters) -> List[dict]:
+        """Up to `limit` messages for the search requests, as the rows of
+        sinks.COLUMNS
+        """
+        found = []
+        with metrics.index_query_seconds.time():
+            for term in list(search_requests) or [None]:
+                for link, messages in self.search(
+                        term, limit=limit - len(found), **filters):
+                    found.extend(dict(zip(COLUMNS, row))
+                                 for row in text_rows(term, messages, link))
+                if len(found) >= limit:
+                    break
+        return found
+
+    def export(self, search_requests: Iterable[str], path: str,
+               export_format: str = 'xlsx', progress: Progress = None,
+               **filters) -> int:
+        """Write the messages for each search request to a sheet of a
+        file, as parse_messages would; how many were written
+        """
+        if progress is None:
+            progress = Progress()
+        terms = list(search_requests) or [None]
+        progress.set(terms_total=len(terms))
+        with open_sink(path, export_format) as workbook:
+            for position, term in enumerate(terms):
+                sheet = workbook.create_sheet(
+                    term or filters.get('username') or EXPORT_SHEET, position
+                )
+                for link, messages in self.search(term, **filters):
+                    progress.check_cancelled()
+                    rows_written = sheet.write_messages(messages, link)
+                    progress.add(messages_written=rows_written)
+                    metrics.rows_written.labels(format=export_format)\
+                        .inc(rows_written)
+                progress.add(terms_done=1)
+        return progress.as_dict()['messages_written']
+
+    def stats(self) -> dict:
+        with self._lock:
+            messages, = self._open().execute(
+                'SELECT COUNT(*) FROM messages'
+            ).fetchone()
+            return {'messages': messages, 'full_text': self.full_text}
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=BUSY_TIMEOUT,
+                               check_same_thread=False)
+
+    def _open(self) -> sqlite3.Connection:
+        """The writing connection, creating the index on first use"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = self._connect()
+            # Crawls in worker processes add to the index while it is read,
+            # and a page's messages are committed without waiting on the disk
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS messages ('
+                'id INTEGER PRIMARY KEY, site TEXT, link TEXT, '
+                'date INTEGER, username TEXT, text TEXT, key BLOB UNIQUE)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS messages_date '
+                'ON messages (date)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS messages_username '
+                'ON messages (username, date)'
+            )
+            self.full_text = _create_full_text(connection)
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+
+def _create_full_text(connection: sqlite3.Connection) -> bool:
+    """Create the FTS5 trigram index of the message texts unless it
+    exists; False if this SQLite has no trigram tokenizer
+    """
+    existing = connection.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'messages_text'"
+    ).fetchone()
+    if existing and 'trigram' in existing[0]:
+        return True
+    if existing:
+        # A word index of an earlier version, which misses infix matches
+        connection.execute('DROP TRIGGER IF EXISTS messages_text_insert')
+        connection.execute('DROP TABLE messages_text')
+    try:
+        # Holds only the index of the folded texts, which SQLite cannot
+        # fold as Python does; the texts are read from `messages`
+        connection.execute(
+            "CREATE VIRTUAL TABLE messages_text USING fts5(text, "
+            "content='', tokenize='trigram case_sensitive 1')"
+        )
+    except sqlite3.OperationalError:
+        return False
+    # Messages added while the index was kept without it
+    connection.executemany(
+        'INSERT INTO messages_text (rowid, text) VALUES (?, ?)',
+        ((rowid, fold(text)) for rowid, text in
+         connection.execute('SELECT id, text FROM messages'))
+    )
+    return True
+
+
+def _message_key(site: str, timestamp: int, username: Optional[str],
+                 text: str) -> bytes:
+    # A message is the same wherever it was found, so not keyed by link
+    return hashlib.sha1(
+        '\0'.join((site, str(timestamp), username or '', text)).encode()
+    ).digest()
+
+
+message_index = MessageIndex()
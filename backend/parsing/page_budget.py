@@ -0,0 +1,154 @@
+import os
+import gzip
+import asyncio
+import tempfile
+import threading
+from collections import namedtuple
+
+from typing import List, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIONS = ('gzip', 'zstd')
+DEFAULT_COMPRESSION = 'zstd' if zstandard else 'gzip'
+GZIP_LEVEL = 1          # pages are read back once, so speed beats size
+ZSTD_LEVEL = 3
+
+
+# A page moved to a compressed file until it is scraped; `text` tells
+# whether it was read as a string or as bytes
+SpilledPage = namedtuple('SpilledPage',
+                         ('path', 'compression', 'size', 'text'))
+
+Content = Union[str, bytes, SpilledPage]
+
+
+def read_page(content: Content) -> Union[str, bytes]:
+    """The HTML of a page, read back from disk if it was spilled"""
+    if not isinstance(content, SpilledPage):
+        return content
+    with open(content.path, 'rb') as file:
+        compressed = file.read()
+    if content.compression == 'zstd':
+        html = zstandard.ZstdDecompressor().decompress(compressed)
+    else:
+        html = gzip.decompress(compressed)
+    return html.decode('utf-8') if content.text else html
+
+
+class PageBudget:
+    """Caps the bytes of raw HTML a job holds between fetching a page and
+    scraping it
+
+    Past `max_bytes` pages are spilled to compressed temporary files when
+    `spill` is set; otherwise holding a page waits until scraped pages
+    have freed enough room. A page always fits when nothing else is held.
+    """
+
+    def __init__(self, max_bytes: int, spill: bool = False,
+                 compression: str = DEFAULT_COMPRESSION):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f'Unknown compression "{compression}"')
+        if compression == 'zstd' and not zstandard:
+            raise ValueError('zstd compression requires the zstandard '
+                             'package')
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self.compression = compression
+        self.held = 0
+        self.peak = 0
+        self.spilled = 0
+        self._directory = None
+        self._changed = threading.Condition()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop,
+                                  asyncio.Future]] = []
+
+    def hold(self, content: Union[str, bytes]) -> Content:
+        """Charge a fetched page to the budget; what to keep instead of it"""
+        size = len(content)
+        with self._changed:
+            if not self.spill:
+                self._changed.wait_for(lambda: self._fits(size))
+            if self._fits(size):
+                self._charge(size)
+                return content
+        return self._spill(content)
+
+    async def ahold(self, content: Union[str, bytes]) -> Content:
+        """`hold` for the event loop, which it never blocks"""
+        size = len(content)
+        loop = asyncio.get_event_loop()
+        while True:
+            with self._changed:
+                if self._fits(size):
+                    self._charge(size)
+                    return content
+                if self.spill:
+                    break
+                released = loop.create_future()
+                self._waiters.append((loop, released))
+            await released
+        return await loop.run_in_executor(None, self._spill, content)
+
+    def release(self, content: Content):
+        """Give back the room of a page once it is scraped"""
+        if isinstance(content, SpilledPage):
+            try:
+                os.remove(content.path)
+            except OSError:
+                pass
+            return
+        with self._changed:
+            self.held -= len(content)
+            self._changed.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, released in waiters:
+            loop.call_soon_threadsafe(_set_done, released)
+
+    def stats(self) -> dict:
+        with self._changed:
+            return {
+                'held_bytes': self.held,
+                'peak_bytes': self.peak,
+                'spilled_pages': self.spilled,
+            }
+
+    def close(self):
+        if self._directory:
+            self._directory.cleanup()
+            self._directory = None
+
+    def _fits(self, size: int) -> bool:
+        return not self.held or self.held + size <= self.max_bytes
+
+    def _charge(self, size: int):
+        self.held += size
+        self.peak = max(self.peak, self.held)
+
+    def _spill(self, content: Union[str, bytes]) -> SpilledPage:
+        text = isinstance(content, str)
+        html = content.encode('utf-8') if text else content
+        if self.compression == 'zstd':
+            compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL)\
+                .compress(html)
+        else:
+            compressed = gzip.compress(html, compresslevel=GZIP_LEVEL)
+        with self._changed:
+            if self._directory is None:
+                self._directory = tempfile.TemporaryDirectory(
+                    prefix='site_parser_pages_'
+                )
+            self.spilled += 1
+        descriptor, path = tempfile.mkstemp(dir=self._directory.name)
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(compressed)
+        return SpilledPage(path, self.compression, len(html), text)
+
+
+def _set_done(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
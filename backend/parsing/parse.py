@@ -1,50 +1,346 @@
-from parsing.helpers import excel_document
+import queue
+import threading
+import contextlib
+from functools import partial
+from urllib.parse import urlsplit
+from collections import namedtuple, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from parsing.sinks import COLUMNS, open_sink, text_rows
 
-from typing import Iterable
-from parsing.crawl import Crawler
+from typing import Iterable, Iterator, List, Tuple
+from parsing.crawl import Crawler, Page
+from parsing.batch import MessageBatch
+from parsing.scrape_pool import ScrapePool
+from parsing.matcher import KeywordMatcher, MatchedBatch
+from parsing.memo import scraped
+from parsing.page_budget import PageBudget, read_page
+from parsing.checkpoints import CheckpointStore, checkpoint_store
+from parsing.message_index import MessageIndex
+from parsing.progress import Progress
 from parsing.exceptions import NoSearchResultsException
+from utils import metrics
+
+
+# `page` and `messages` are None once the term is exhausted
+TermPage = namedtuple(
+    'TermPage', ('search_counter', 'search_request', 'page', 'messages')
+)
 
 
 def parse_messages(crawler: Crawler,
                    search_requests: Iterable[str],
                    workbook_path: str,
                    search_one_page_only: bool,
-                   max_pages: int):
-    row_counter = 1
+                   max_pages: int,
+                   progress: Progress = None,
+                   concurrency: int = 1,
+                   parse_workers: int = 0,
+                   incremental: bool = False,
+                   export_format: str = 'xlsx',
+                   page_memory_mb: int = 0,
+                   spill_pages: bool = False,
+                   message_index: MessageIndex = None) -> dict:
+    """Write the messages found for every search request to a workbook,
+    or a file in another of sinks.FORMATS
 
-    with excel_document(workbook_path) as workbook:
-        for search_counter, search_request in enumerate(search_requests):
-            try:
-                search_results = crawler.search(
-                    search_request,
-                    one_page_only=search_one_page_only,
-                    max_pages=max_pages
-                )
-            except NoSearchResultsException:
+    Returns how many thread pages were requested and how many of them
+    were actually fetched and parsed.
+    """
+    if progress is None:
+        progress = Progress()
+    with crawl_terms(crawler, search_requests, search_one_page_only,
+                     max_pages, progress, concurrency, parse_workers,
+                     incremental, page_memory_mb, spill_pages,
+                     message_index) as term_pages, \
+            open_sink(workbook_path, export_format) as workbook:
+        sheets = {}
+        for search_counter, search_request, page, messages in term_pages:
+            if page is None:
+                progress.add(terms_done=1)
                 continue
 
-            if not search_results:
-                print(f'Search request "{search_request}": nothing found')
-                continue
+            sheet = sheets.get(search_counter)
+            if sheet is None:
+                sheet = workbook.create_sheet(search_request, search_counter)
+                sheets[search_counter] = sheet
+
+            rows_written = sheet.write_messages(messages, page.link)
+            progress.add(messages_written=rows_written)
+            metrics.rows_written.labels(format=export_format)\
+                .inc(rows_written)
+    return crawler.memo.stats()
+
+
+def stream_messages(crawler: Crawler,
+                    search_requests: Iterable[str],
+                    search_one_page_only: bool,
+                    max_pages: int,
+                    progress: Progress = None,
+                    concurrency: int = 1,
+                    parse_workers: int = 0,
+                    incremental: bool = False,
+                    page_memory_mb: int = 0,
+                    spill_pages: bool = False,
+                    message_index: MessageIndex = None) -> Iterator[dict]:
+    """Yield the messages found for every search request as they are
+    scraped, instead of writing them to a file
+
+    Events are dicts with an "event" key: a "message" has the columns of
+    sinks.COLUMNS, a "progress" follows every page and finished term, and
+    "done" ends the stream with the page stats. Pages are only fetched as
+    fast as the events are consumed, and closing the generator stops the
+    crawl.
+    """
+    if progress is None:
+        progress = Progress()
+    with crawl_terms(crawler, search_requests, search_one_page_only,
+                     max_pages, progress, concurrency, parse_workers,
+                     incremental, page_memory_mb, spill_pages,
+                     message_index) as term_pages:
+        for search_counter, search_request, page, messages in term_pages:
+            if page is None:
+                progress.add(terms_done=1)
+            else:
+                for row in text_rows(search_request, messages, page.link):
+                    yield dict(zip(COLUMNS, row), event='message')
+                progress.add(messages_written=len(messages))
+            yield dict(progress.as_dict(), event='progress')
+    yield {'event': 'done', 'pages': crawler.memo.stats()}
+
+
+@contextlib.contextmanager
+def crawl_terms(crawler: Crawler,
+                search_requests: Iterable[str],
+                search_one_page_only: bool,
+                max_pages: int,
+                progress: Progress,
+                concurrency: int = 1,
+                parse_workers: int = 0,
+                incremental: bool = False,
+                page_memory_mb: int = 0,
+                spill_pages: bool = False,
+                message_index: MessageIndex = None
+                ) -> Iterator[Iterator[TermPage]]:
+    """The scraped pages of every search request, as TermPages
+
+    With `page_memory_mb`, the HTML of pages fetched but not scraped yet
+    is kept under that many megabytes, by spilling pages to compressed
+    files with `spill_pages` and by pausing the fetching without. With a
+    message index, every message scraped is added to it.
+    """
+    search_requests = list(search_requests)
+    progress.set(terms_total=len(search_requests))
+    if page_memory_mb:
+        crawler.memo.budget = PageBudget(page_memory_mb * 1024 * 1024,
+                                         spill_pages)
+
+    matcher = KeywordMatcher(search_requests)
+    scrape_pool = ScrapePool(parse_workers, matcher) if parse_workers \
+        else None
+    term_crawler = TermCrawler(crawler, search_one_page_only, max_pages,
+                               progress, matcher, scrape_pool,
+                               checkpoint_store, incremental, message_index)
+    if concurrency > 1:
+        term_pages = term_crawler.crawl_concurrently(search_requests,
+                                                     concurrency)
+    else:
+        term_pages = term_crawler.crawl_all(search_requests)
+
+    try:
+        yield term_pages
+    finally:
+        # Stops the term threads of a crawl left before its end
+        term_pages.close()
+        if scrape_pool:
+            scrape_pool.close()
+        if crawler.memo.budget:
+            crawler.memo.budget.close()
+
+
+class TermCrawler:
+    """Searches terms and scrapes the pages found for parse_messages
+
+    With a scrape pool, pages are scraped in worker processes while the
+    next ones are being fetched. A page found by several terms is scraped
+    once, and each message is matched against all the terms in one pass.
+    All the messages of a scraped page, matching or not, go to the message
+    index when there is one.
+    """
 
-            sheet = workbook.create_sheet(search_request, search_counter)
-            sheet.title = search_request
+    def __init__(self, crawler: Crawler,
+                 search_one_page_only: bool,
+                 max_pages: int,
+                 progress: Progress,
+                 matcher: KeywordMatcher,
+                 scrape_pool: ScrapePool = None,
+                 checkpoints: CheckpointStore = None,
+                 incremental: bool = False,
+                 message_index: MessageIndex = None):
+        self.crawler = crawler
+        self.search_one_page_only = search_one_page_only
+        self.max_pages = max_pages
+        self.progress = progress
+        self.matcher = matcher
+        self.scrape_pool = scrape_pool
+        self.checkpoints = checkpoints
+        self.incremental = incremental
+        self.message_index = message_index
 
-            for page in search_results:
-                messages = crawler.get_messages(page.html, search_request)
-                for message in messages:
-                    cell_1 = sheet.cell(row=row_counter, column=1)
-                    cell_1.value = message.date.strftime("%Y/%m/%d  %H:%M")
+    def crawl(self,
+              search_request: str) -> Iterator[Tuple[Page, MessageBatch]]:
+        """Search for a term and scrape the matching messages page by page
 
-                    cell_2 = sheet.cell(row=row_counter, column=2)
-                    cell_2.value = message.username
-                    cell_2.style = "Hyperlink"
-                    cell_2.hyperlink = page.link
+        In incremental mode threads crawled before are not fetched again
+        from the search results; only the pages added after the last one
+        read are, and only the messages newer than the ones taken before
+        are kept.
+        """
+        known_threads = {}
+        if self.incremental and self.checkpoints:
+            known_threads = self.checkpoints.threads(
+                self.crawler.main_page_link, search_request
+            )
 
-                    cell_3 = sheet.cell(row=row_counter, column=3)
-                    cell_3.value = message.text
+        pages_found = 0
+        search_results = self.crawler.search(
+            search_request,
+            one_page_only=self.search_one_page_only,
+            max_pages=self.max_pages,
+            skip=known_threads.keys()
+        )
+        try:
+            for page, messages in self._scrape(search_results,
+                                               search_request):
+                pages_found += 1
+                yield page, messages
+                self._checkpoint(search_request, page.link, page, messages)
+        except NoSearchResultsException:
+            return
 
-                    row_counter += 1
+        for thread_url, checkpoint in known_threads.items():
+            # The cached copy of the last page predates its new posts
+            thread_pages = self.crawler.get_thread_pages(
+                checkpoint.last_page_url, revalidate=True
+            )
+            for page, messages in self._scrape(thread_pages, search_request):
+                messages = messages.newer_than(checkpoint.newest_message)
+                pages_found += 1
+                yield page, messages
+                self._checkpoint(search_request, thread_url, page, messages)
+
+        if not pages_found:
+            print(f'Search request "{search_request}": nothing found')
+
+    def _scrape(self, pages: Iterable[Page],
+                search_request: str) -> Iterator[Tuple[Page, MessageBatch]]:
+        scraping = deque()
+        for page in pages:
+            self.progress.check_cancelled()
+            self.progress.add(pages_fetched=1)
+
+            scraping.append((page, self.crawler.memo.messages(
+                page.link, page.html, partial(self._parse, page.link)
+            )))
+            while scraping and scraping[0][1].done():
+                page, messages = scraping.popleft()
+                yield page, self._found(messages.result(), search_request)
+
+        while scraping:
+            page, messages = scraping.popleft()
+            yield page, self._found(messages.result(), search_request)
+
+    def _parse(self, link: str, html: str) -> Future:
+        if self.scrape_pool is None:
+            scraper = self.crawler.scraper
+            with metrics.parse_seconds\
+                    .labels(scraper=type(scraper).__name__).time():
+                messages = self.matcher.match_batch(
+                    scraper.get_all_messages(read_page(html))
+                )
+            scraping = scraped(messages)
+        else:
+            scraping = self.scrape_pool.submit(self.crawler.scraper, html)
+        if self.message_index:
+            scraping.add_done_callback(partial(self._index, link))
+        return scraping
+
+    def _index(self, link: str, scraping: Future):
+        # The memo scrapes a page once, so it is indexed once per job
+        if scraping.cancelled() or scraping.exception():
+            return
+        self.message_index.add(urlsplit(self.crawler.main_page_link).hostname,
+                               link, scraping.result().messages)
+
+    @staticmethod
+    def _found(messages: MatchedBatch,
+               search_request: str) -> MessageBatch:
+        return messages.found(search_request)
+
+    def _checkpoint(self, search_request: str, thread_url: str, page: Page,
+                    messages: MessageBatch):
+        # Called once the page has been handed over, so an interrupted job
+        # resumes after the last page it delivered
+        if not self.checkpoints:
+            return
+        newest_message = max(messages.timestamps, default=0)
+        self.checkpoints.record(self.crawler.main_page_link, search_request,
+                                thread_url, page.link, newest_message)
+
+    def crawl_all(self, search_requests: List[str]) -> Iterator[TermPage]:
+        for search_counter, search_request in enumerate(search_requests):
+            self.progress.check_cancelled()
+            for page, messages in self.crawl(search_request):
+                yield TermPage(search_counter, search_request, page, messages)
+            yield TermPage(search_counter, search_request, None, None)
+
+    def crawl_concurrently(self, search_requests: List[str],
+                           concurrency: int) -> Iterator[TermPage]:
+        """Crawl up to `concurrency` terms at once
+
+        Scraped pages are handed over through a bounded queue, so the
+        consumer stays the only one touching the workbook.
+        """
+        term_pages = queue.Queue(maxsize=concurrency * 2)
+        stopped = threading.Event()
+
+        def crawl(search_counter: int, search_request: str):
+            try:
+                for page, messages in self.crawl(search_request):
+                    if stopped.is_set():
+                        return
+                    term_pages.put(TermPage(search_counter, search_request,
+                                            page, messages))
+            finally:
+                term_pages.put(
+                    TermPage(search_counter, search_request, None, None)
+                )
+
+        with ThreadPoolExecutor(max_workers=concurrency,
+                                thread_name_prefix='term') as executor:
+            futures = [
+                executor.submit(crawl, search_counter, search_request)
+                for search_counter, search_request
+                in enumerate(search_requests)
+            ]
+            try:
+                terms_left = len(futures)
+                while terms_left:
+                    term_page = term_pages.get()
+                    if term_page.page is None:
+                        terms_left -= 1
+                        # Reraise whatever stopped the term's crawl
+                        futures[term_page.search_counter].result()
+                    yield term_page
+            finally:
+                stopped.set()
+                for future in futures:
+                    future.cancel()
+                # Unblock the workers still waiting on a full queue
+                while not all(future.done() for future in futures):
+                    try:
+                        term_pages.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
 
 
 if __name__ == '__main__':
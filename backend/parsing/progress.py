@@ -0,0 +1,42 @@
+import threading
+
+from parsing.exceptions import JobCancelledException
+
+
+class Progress:
+    """Thread-safe counters of a running parse, with a cancellation flag"""
+    COUNTERS = ('terms_total', 'terms_done',
+                'pages_fetched', 'messages_written')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def add(self, **counters: int):
+        with self._lock:
+            for name, value in counters.items():
+                self._counters[name] += value
+
+    def set(self, **counters: int):
+        with self._lock:
+            self._counters.update(counters)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def wait_cancelled(self, timeout: float) -> bool:
+        """Sleep until cancelled or for `timeout` seconds"""
+        return self._cancelled.wait(timeout)
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelledException('The job has been cancelled')
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
@@ -1,34 +1,22 @@
-import re
-import locale
-from datetime import datetime
 from collections import namedtuple
 from itertools import chain
 from typing import List
-from bs4 import BeautifulSoup
-from bs4.element import Tag
+from parsing.html_backends import HTMLBackend, get_backend
+from parsing.batch import MessageBatch
+from parsing.dates import parse_iso, parse_russian, to_datetime
 
 
 Message = namedtuple("Message", ("text", "date", "username"))
 _Message_html = namedtuple("_Message_html", ("message_tree", "text"))
 
-try:
-    locale.setlocale(locale.LC_ALL, ('RU', 'UTF-8'))
-except locale.Error:
-    try:
-        locale.setlocale(locale.LC_ALL, ('Russian_Russia', '1251'))
-    except locale.Error:
-        try:
-            locale.setlocale(locale.LC_ALL, ('Russian_Ukraine', '1251'))
-        except locale.Error:
-            locale.setlocale(locale.LC_ALL, '')
-
 
 class MessageScraper:
-    OMIT_HTML_PATTERN = r"(?<=>)[^<]+"
+    def __init__(self, backend: HTMLBackend = None):
+        self.backend = backend if backend else get_backend()
 
     def get_messages(self, content, search_term: str) -> List[Message]:
-        soup = BeautifulSoup(content, "html.parser")
-        messages = self.acquire_messages(soup)
+        page = self.backend.parse(content)
+        messages = self.acquire_messages(page)
         messages_html = (
             _Message_html(msg, self.acquire_msg_text(msg)) for msg in messages
         )
@@ -37,20 +25,20 @@ class MessageScraper:
         )
         return (self.formalize_message(msg) for msg in searched_messages)
 
-    @classmethod
-    def formalize_message(cls, msg_html: _Message_html):
+    def get_all_messages(self, content) -> MessageBatch:
+        page = self.backend.parse(content)
+        batch = MessageBatch()
+        for msg in self.acquire_messages(page):
+            batch.append(self.acquire_date(msg), self.acquire_author(msg),
+                         self.acquire_msg_text(msg))
+        return batch
+
+    def formalize_message(self, msg_html: _Message_html):
         msg_text = msg_html.text
-        msg_date = cls.acquire_date(msg_html.message_tree)
-        msg_author = cls.acquire_author(msg_html.message_tree)
+        msg_date = to_datetime(self.acquire_date(msg_html.message_tree))
+        msg_author = self.acquire_author(msg_html.message_tree)
         return Message(text=msg_text, date=msg_date, username=msg_author)
 
-    @classmethod
-    def omit_html_tags(cls, html: Tag) -> str:
-        html_string = str(html)
-        matches = re.finditer(cls.OMIT_HTML_PATTERN, html_string)
-        msg = " ".join(match.group(0).strip() for match in matches)
-        return msg
-
     @staticmethod
     def _check_for_search_term(search_term: str):
         def contain_search_term(msg_html: _Message_html):
@@ -58,74 +46,64 @@ class MessageScraper:
 
         return contain_search_term
 
-    @staticmethod
-    def acquire_messages(page: Tag):
+    def acquire_messages(self, page):
         raise NotImplementedError
 
-    @classmethod
-    def acquire_msg_text(cls, msg_tree: Tag) -> str:
+    def acquire_msg_text(self, msg_tree) -> str:
         raise NotImplementedError
 
-    @staticmethod
-    def acquire_date(msg_tree: Tag):
+    def acquire_date(self, msg_tree) -> int:
+        """Epoch seconds the message was posted at"""
         raise NotImplementedError
 
-    @staticmethod
-    def acquire_author(msg_tree: Tag):
+    def acquire_author(self, msg_tree):
         raise NotImplementedError
 
 
 class BHFScraper(MessageScraper):
-    @staticmethod
-    def acquire_messages(page: Tag):
-        return page.findAll("article", {"class": "message"})
+    def acquire_messages(self, page):
+        return self.backend.find_all(page, "article", "message")
 
-    @classmethod
-    def acquire_msg_text(cls, msg_tree: Tag) -> str:
-        msg_block = msg_tree.find("div", {"class": "bbWrapper"})
-        quotes = msg_block.findAll("blockquote")
-        for quote in quotes:
-            quote.extract()
-        return cls.omit_html_tags(msg_block)
+    def acquire_msg_text(self, msg_tree) -> str:
+        msg_block = self.backend.find(msg_tree, "div", "bbWrapper")
+        return self.backend.text(msg_block, exclude=("blockquote",))
 
-    @staticmethod
-    def acquire_date(msg_tree: Tag):
-        datetime_str = msg_tree.find("time")["datetime"]
-        return datetime.strptime(datetime_str, "%Y-%m-%dT%H:%M:%S%z")
+    def acquire_date(self, msg_tree) -> int:
+        time_tag = self.backend.find(msg_tree, "time")
+        return parse_iso(self.backend.attr(time_tag, "datetime"))
 
-    @staticmethod
-    def acquire_author(msg_tree: Tag):
-        return (
-            msg_tree.find("h4", {"class": "message-name"})
-            .find("a", {"class": re.compile("^username")})
-            .string
-        )
+    def acquire_author(self, msg_tree):
+        name_block = self.backend.find(msg_tree, "h4", "message-name")
+        username = self.backend.find(name_block, "a", "username",
+                                     class_prefix=True)
+        return self.backend.string(username)
 
 
 class LolzScraper(MessageScraper):
-    @staticmethod
-    def acquire_messages(page: Tag):
-        messages = page.findAll("li", {"class": "message"})
-        comments = page.findAll("li", {"class": "comment"})
+    def acquire_messages(self, page):
+        messages = self.backend.find_all(page, "li", "message")
+        comments = self.backend.find_all(page, "li", "comment")
         return chain(messages, comments)
 
-    @classmethod
-    def acquire_msg_text(cls, msg_tree: Tag) -> str:
-        msg_block = msg_tree.find("blockquote", {"class": "messageText"})
-        return cls.omit_html_tags(msg_block).replace('"', '')
-
-    @staticmethod
-    def acquire_date(msg_tree: Tag):
-        try:
-            datetime_str = msg_tree.find("span", {"class": "DateTime"})["title"]    # noqa: E501
-        except TypeError:
-            datetime_str = msg_tree.find("abbr", {"class": "DateTime"}).text
+    def acquire_msg_text(self, msg_tree) -> str:
+        msg_block = self.backend.find(msg_tree, "blockquote", "messageText")
+        return self.backend.text(msg_block).replace('"', '')
+
+    def acquire_date(self, msg_tree) -> int:
+        date_tag = self.backend.find(msg_tree, "span", "DateTime")
+        if date_tag is not None:
+            datetime_str = self.backend.attr(date_tag, "title")
+        else:
+            date_tag = self.backend.find(msg_tree, "abbr", "DateTime")
+            timestamp = self.backend.attr(date_tag, "data-time")
+            if timestamp:
+                return int(timestamp)
+            datetime_str = self.backend.full_text(date_tag)
         # 12 авг 2020 в 17:41
-        return datetime.strptime(datetime_str, "%d %b %Y в %H:%M")
+        return parse_russian(datetime_str)
 
-    @staticmethod
-    def acquire_author(msg_tree: Tag):
-        return msg_tree["data-author"]
+    def acquire_author(self, msg_tree):
+        return self.backend.attr(msg_tree, "data-author")
 
 
 if __name__ == "__main__":
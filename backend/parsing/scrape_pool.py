@@ -0,0 +1,84 @@
+import time
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from typing import Dict, Tuple, Type
+from parsing.scrape import MessageScraper
+from parsing.matcher import KeywordMatcher, MatchedBatch
+from parsing.html_backends import get_backend
+from parsing.page_budget import read_page
+from utils import metrics
+
+
+# Scrapers built so far in a worker process
+_scrapers: Dict[Tuple[Type[MessageScraper], str], MessageScraper] = {}
+# The job's keywords, compiled once per worker process
+_matcher: KeywordMatcher = None
+
+
+def _set_matcher(matcher: KeywordMatcher):
+    global _matcher
+    _matcher = matcher
+
+
+def _scrape(scraper_class: Type[MessageScraper], backend_name: str,
+            content) -> Tuple[MatchedBatch, float]:
+    started = time.perf_counter()
+    key = (scraper_class, backend_name)
+    scraper = _scrapers.get(key)
+    if scraper is None:
+        scraper = _scrapers[key] = scraper_class(get_backend(backend_name))
+    messages = _matcher.match_batch(
+        scraper.get_all_messages(read_page(content))
+    )
+    # Metrics live in the main process, so the parse time is sent back
+    return messages, time.perf_counter() - started
+
+
+class ScrapePool:
+    """Scrapes pages in worker processes
+
+    At most `max_pending` pages wait for a worker at once; `submit` blocks
+    until one is done, which pauses whoever fetches the pages.
+    """
+
+    def __init__(self, workers: int, matcher: KeywordMatcher,
+                 max_pending: int = None):
+        self._executor = ProcessPoolExecutor(max_workers=workers,
+                                             initializer=_set_matcher,
+                                             initargs=(matcher,))
+        self._pending = threading.BoundedSemaphore(
+            max_pending if max_pending else workers * 2
+        )
+
+    def submit(self, scraper: MessageScraper, content) -> Future:
+        """Future of every message on the page with the keywords it has"""
+        self._pending.acquire()
+        try:
+            future = self._executor.submit(
+                _scrape, type(scraper), scraper.backend.name, content
+            )
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return self._messages(future, type(scraper).__name__)
+
+    @staticmethod
+    def _messages(scraped: Future, scraper_name: str) -> Future:
+        messages = Future()
+
+        def observe(scraped: Future):
+            if scraped.exception():
+                messages.set_exception(scraped.exception())
+                return
+            result, seconds = scraped.result()
+            metrics.parse_seconds.labels(scraper=scraper_name)\
+                .observe(seconds)
+            messages.set_result(result)
+
+        scraped.add_done_callback(observe)
+        return messages
+
+    def close(self):
+        self._executor.shutdown()
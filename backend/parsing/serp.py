@@ -0,0 +1,293 @@
+import re
+import random
+import asyncio
+import aiohttp
+from collections import namedtuple
+from urllib.parse import (
+    parse_qs, parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+)
+from parsing.session_managers import SessionManager
+from parsing.html_backends import HTMLBackend, get_backend
+from utils.http_client import async_client
+from utils.search_engines import get_server
+
+from typing import AsyncIterator, List, Optional, Sequence, Set
+
+
+# A search engine results page: the result links and the next page's URL
+ResultsPage = namedtuple('ResultsPage', ('links', 'next_url'))
+
+SEARCH_DEADLINE = 120   # seconds
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+TRACKING_PARAM_PATTERN = re.compile(r'^(utm_\w+|fbclid|gclid|yclid)$')
+
+
+def normalize_url(url: str) -> str:
+    """The form of a result URL used to tell results apart
+
+    The scheme and host are lowercased, default ports, fragments and
+    tracking parameters dropped.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = parts.hostname or ''
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    query = parts.query
+    params = parse_qsl(query, keep_blank_values=True)
+    if any(TRACKING_PARAM_PATTERN.match(name) for name, _ in params):
+        query = urlencode([(name, value) for name, value in params
+                           if not TRACKING_PARAM_PATTERN.match(name)])
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+class SearchEngine:
+    """A web search engine whose results pages are scraped
+
+    Pages are fetched on the shared async client and parsed once each for
+    both their links and the next page's URL, and the next page is
+    requested while the links of the current one are being handled.
+    """
+    name = None
+    ROOT_URL = None
+    PAGE_ATTEMPTS = 3
+
+    def __init__(self, root_url: str = None,
+                 session_manager: SessionManager = None,
+                 backend: HTMLBackend = None,
+                 user_agents: Sequence[str] = None):
+        self.root_url = root_url or self.ROOT_URL
+        self.session_manager = session_manager or \
+            SessionManager(use_cache=False)
+        self.backend = backend or get_backend()
+        self._user_agents = user_agents
+
+    def first_page_url(self, query: str) -> str:
+        raise NotImplementedError
+
+    def parse_results_page(self, html) -> ResultsPage:
+        raise NotImplementedError
+
+    async def search(self, query: str, one_page_only: bool,
+                     max_pages: int) -> AsyncIterator[str]:
+        """Yield the result links of up to `max_pages` pages
+
+        Must be iterated on the shared async client's loop.
+        """
+        pages = self.pages(query, one_page_only, max_pages)
+        try:
+            async for links in pages:
+                for link in links:
+                    yield link
+        finally:
+            await pages.aclose()
+
+    async def pages(self, query: str, one_page_only: bool,
+                    max_pages: int) -> AsyncIterator[List[str]]:
+        """Yield the normalized links of every results page, stopping at
+        the first page without links the previous ones did not have
+        """
+        aiosession = await async_client.session()
+        seen_links = set()
+        next_page = asyncio.ensure_future(
+            self._get_results_page(self.first_page_url(query), aiosession)
+        )
+        page_num = 1
+        try:
+            while next_page:
+                results_page = await next_page
+                next_page = None
+                links = _new_links(results_page.links, seen_links)
+                if not links:
+                    return
+                if results_page.next_url and not one_page_only \
+                        and page_num < max_pages:
+                    next_page = asyncio.ensure_future(self._get_results_page(
+                        results_page.next_url, aiosession
+                    ))
+                    page_num += 1
+                yield links
+        finally:
+            if next_page:
+                next_page.cancel()
+
+    async def _get_results_page(self, url: str, aiosession) -> ResultsPage:
+        # Blocked requests get a page without results, so those are
+        # retried, each time through another proxy
+        loop = asyncio.get_event_loop()
+        for _ in range(self.PAGE_ATTEMPTS):
+            headers = {'User-Agent': await self._user_agent()}
+            try:
+                _, html = await self.session_manager.afetch(url, aiosession,
+                                                            headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                continue
+            results_page = await loop.run_in_executor(
+                None, self.parse_results_page, html
+            )
+            if results_page.links:
+                return results_page
+        print(f'No search results on {url}')
+        return ResultsPage([], None)
+
+    async def _user_agent(self) -> str:
+        if self._user_agents is None:
+            # Getting the server may scrape proxies, so not on the loop
+            loop = asyncio.get_event_loop()
+            self._user_agents = await loop.run_in_executor(
+                None, self._load_user_agents
+            )
+        return random.choice(self._user_agents)
+
+    @staticmethod
+    def _load_user_agents() -> List[str]:
+        # The search engine scraper's list, read with its server
+        return [agent.decode() if isinstance(agent, bytes) else agent
+                for agent in get_server().user_agents]
+
+
+class BingSearch(SearchEngine):
+    name = 'bing'
+    ROOT_URL = 'https://www.bing.com'
+
+    def first_page_url(self, query: str) -> str:
+        return f'{self.root_url}/search?{urlencode({"q": query})}'
+
+    def parse_results_page(self, html) -> ResultsPage:
+        # Only the result headings: the navigation and footer links are on
+        # every page, blocked ones included
+        page = self.backend.parse(html)
+        links = []
+        for result in self.backend.find_all(page, 'li', 'b_algo'):
+            heading = self.backend.find(result, 'h2')
+            if heading is None:
+                continue
+            link = self.backend.find(heading, 'a')
+            href = link is not None and self.backend.attr(link, 'href')
+            if href and href.startswith('http'):
+                links.append(href)
+        return ResultsPage(links, self._get_next_page_url(page))
+
+    def _get_next_page_url(self, page) -> Optional[str]:
+        next_link = self.backend.find(page, 'a', 'sb_pagN')
+        if next_link is None or \
+                'sb_inactP' in (self.backend.attr(next_link, 'class') or ''):
+            return None
+        return urljoin(self.root_url, self.backend.attr(next_link, 'href'))
+
+
+class GoogleSearch(SearchEngine):
+    name = 'google'
+    ROOT_URL = 'https://www.google.com'
+    REDIRECT_PATH = '/url'
+
+    def first_page_url(self, query: str) -> str:
+        return f'{self.root_url}/search?{urlencode({"q": query, "hl": "en"})}'
+
+    def parse_results_page(self, html) -> ResultsPage:
+        page = self.backend.parse(html)
+        links, next_url = [], None
+        for link in self.backend.find_all(page, 'a'):
+            href = self.backend.attr(link, 'href')
+            if not href:
+                continue
+            if self.backend.attr(link, 'id') == 'pnnext':
+                next_url = urljoin(self.root_url, href)
+                continue
+            target = self._result_url(href)
+            if target:
+                links.append(target)
+        return ResultsPage(links, next_url)
+
+    def _result_url(self, href: str) -> Optional[str]:
+        # Without scripts results link through /url?q=<target>
+        parts = urlsplit(href)
+        if parts.path == self.REDIRECT_PATH and \
+                (not parts.netloc or 'google' in parts.netloc):
+            href = parse_qs(parts.query).get('q', [''])[0]
+            parts = urlsplit(href)
+        if parts.scheme not in DEFAULT_PORTS or 'google' in parts.netloc:
+            return None
+        return href
+
+
+class FederatedSearch:
+    """Queries several search engines at once and merges their results
+
+    Links are yielded in the order they arrive, each once. An engine is
+    stopped at its first page that only has links already found, and
+    every engine when the deadline passes; the links found by then are
+    still yielded.
+    """
+
+    def __init__(self, engines: Sequence[SearchEngine],
+                 deadline: float = SEARCH_DEADLINE):
+        self.engines = engines
+        self.deadline = deadline
+
+    async def search(self, query: str, one_page_only: bool,
+                     max_pages: int) -> AsyncIterator[str]:
+        """Must be iterated on the shared async client's loop"""
+        links = asyncio.Queue()
+        seen_links = set()
+        tasks = [
+            asyncio.ensure_future(self._search_engine(
+                engine, query, one_page_only, max_pages, links, seen_links
+            ))
+            for engine in self.engines
+        ]
+        for task in tasks:
+            # One stop mark per engine, however it ended
+            task.add_done_callback(lambda _: links.put_nowait(None))
+
+        def stop_engines():
+            print(f'Search for "{query}" stopped at its '
+                  f'{self.deadline} seconds deadline')
+            for task in tasks:
+                task.cancel()
+
+        # Only the engines are timed: the links they found are yielded
+        # however long the consumer takes over them
+        deadline = asyncio.get_event_loop().call_later(self.deadline,
+                                                       stop_engines)
+        try:
+            engines_left = len(tasks)
+            while engines_left:
+                link = await links.get()
+                if link is None:
+                    engines_left -= 1
+                    continue
+                yield link
+        finally:
+            deadline.cancel()
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def _search_engine(engine: SearchEngine, query: str,
+                             one_page_only: bool, max_pages: int,
+                             links: asyncio.Queue, seen_links: Set[str]):
+        pages = engine.pages(query, one_page_only, max_pages)
+        try:
+            async for page_links in pages:
+                new_links = _new_links(page_links, seen_links)
+                if not new_links:
+                    break
+                for link in new_links:
+                    links.put_nowait(link)
+        except Exception as e:
+            print(f'{engine.name} search failed: {type(e).__name__}: {e}')
+        finally:
+            await pages.aclose()
+
+
+def _new_links(links: List[str], seen_links: Set[str]) -> List[str]:
+    """Normalize the links, keep the ones not in `seen_links` and add
+    them to it
+    """
+    new_links = []
+    for link in map(normalize_url, links):
+        if link not in seen_links:
+            seen_links.add(link)
+            new_links.append(link)
+    return new_links
@@ -1,55 +1,179 @@
+import re
+import time
 import base64
 import asyncio
 import aiohttp
-import requests
-from requests import Session, Response
+from urllib.parse import urlsplit
+from requests import Response, RequestException
 from bs4 import BeautifulSoup
 from bs4.element import Tag
-from search_engine_scraper import server
 from parsing.exceptions import ServerIsDownException
+from utils import http_client
+from utils.http_client import async_client
+from utils.http_cache import HTTPCache, http_cache
+from utils.scheduler import request_scheduler
+from utils.proxies import BLOCK_STATUSES, ProxyManager, proxy_manager
+from utils import metrics
+from utils.auth_pool import auth_pool
 from typing import Iterable
 from secrets_archive import lolz_login, lolz_password
 
 
 class SessionManager:
-    def __init__(self, cookies=None):
+    FETCH_ATTEMPTS = 4
+
+    def __init__(self, cookies=None, headers=None, use_cache=True):
         self.cookies = cookies if cookies else {}
-        self.server = server
+        self.headers = headers if headers else {}
+        self.proxies = proxy_manager
+        self.cache = http_cache if use_cache else None
+
+    async def afetch(self, url: str, session: aiohttp.ClientSession,
+                     headers: dict = None):
+        # The cache is an SQLite file, kept off the event loop
+        loop = asyncio.get_event_loop()
+        cached = await loop.run_in_executor(None, self.cache.lookup, url) \
+            if self.cache else None
+        if cached and cached.fresh:
+            return url, cached.body
+
+        headers = {**self.headers, **(headers or {}),
+                   **HTTPCache.validators(cached)}
+        response, html = await self._arequest(url, session, headers)
+        if self._logged_out(html):
+            await loop.run_in_executor(None, self._renew_session)
+            response, html = await self._arequest(url, session, headers)
 
-    async def afetch(self, url: str, session):
-        proxy = next(self.server.proxy_pool)
-        async with session.get(url, proxy=proxy) as response:
-            html = await response.read()
-            return url, html
+        if response.status == 304 and cached:
+            await loop.run_in_executor(None, self.cache.refresh, url)
+            return url, cached.body
+        if self.cache and response.status == 200 and \
+                not self._logged_out(html):
+            await loop.run_in_executor(
+                None, self.cache.store, url, html, response.charset,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified')
+            )
+        return url, html
+
+    async def _arequest(self, url: str, session: aiohttp.ClientSession,
+                        headers: dict):
+        host = urlsplit(url).netloc
+        response = error = html = None
+        for attempt in range(self.FETCH_ATTEMPTS):
+            if attempt:
+                metrics.fetch_retries.labels(host=host).inc()
+            async with request_scheduler.slot(url):
+                proxy = await self.proxies.aacquire()
+                started = time.monotonic()
+                try:
+                    async with session.get(url,
+                                           proxy=ProxyManager.url(proxy),
+                                           headers=headers,
+                                           cookies=self.cookies) as response:
+                        html = await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self._observe_fetch(host, 'error', started)
+                    self.proxies.report_failure(proxy)
+                    response, error = None, e
+                    continue
+                self._observe_fetch(host, response.status, started)
+                self._report_proxy(proxy, response.status, started)
+            if not request_scheduler.feedback(url, response.status,
+                                              response.headers, html):
+                break
+        if response is None:
+            raise error
+        return response, html
 
     async def fetch(self, urls: Iterable[str]):
-        async with aiohttp.ClientSession(headers=self.headers,
-                                         cookies=self.cookies) as aiosession:
-            tasks = [self.afetch(url, aiosession) for url in urls]
-            return await asyncio.gather(*tasks)
+        """Must be awaited on the shared async client's loop"""
+        aiosession = await async_client.session()
+        tasks = [self.afetch(url, aiosession) for url in urls]
+        return await asyncio.gather(*tasks)
 
     def post(self, url, **kwargs) -> Response:
-        return requests.post(url, cookies=self.cookies, **kwargs)
+        kwargs.setdefault('cookies', self.cookies)
+        return http_client.post(url, **kwargs)
 
     def get(self, url, **kwargs) -> Response:
+        kwargs.setdefault('cookies', self.cookies)
+        host = urlsplit(url).netloc
         for i in range(1, 21):
+            if i > 1:
+                metrics.fetch_retries.labels(host=host).inc()
+            proxy = self.proxies.acquire()
+            started = time.monotonic()
             try:
-                proxy = next(self.server.proxy_pool)
-                resp = requests.get(url, cookies=self.cookies,
-                                    proxies={'http': proxy},
-                                    **kwargs)
-                if resp.status_code == 200:
-                    break
-            except Exception:
+                resp = http_client.get(url, proxies={'http': proxy},
+                                       **kwargs)
+            except RequestException:
+                self._observe_fetch(host, 'error', started)
+                self.proxies.report_failure(proxy)
                 resp = None
+                continue
+            self._observe_fetch(host, resp.status_code, started)
+            self._report_proxy(proxy, resp.status_code, started)
+            # Blocked requests and server errors are tried again, any other
+            # answer is the page's own
+            if resp.status_code not in BLOCK_STATUSES and \
+                    resp.status_code < 500:
+                break
         return resp
 
-    def get_page(self, url: str) -> str:
-        response = self.get(url)
+    def get_page(self, url: str, revalidate: bool = False) -> str:
+        """The page at `url`, from the cache while it is fresh
+
+        With `revalidate`, a cached page is only reused once the site
+        answers that it has not changed.
+        """
+        cached = self.cache.lookup(url) if self.cache else None
+        if cached and cached.fresh and not revalidate:
+            return self._decode(cached.body, cached.encoding)
+
+        response = self.get(url, headers=HTTPCache.validators(cached))
+        if response and self._logged_out(response.content):
+            self._renew_session()
+            response = self.get(url, headers=HTTPCache.validators(cached))
         if not response:
             return ''
+        if response.status_code == 304 and cached:
+            self.cache.refresh(url)
+            return self._decode(cached.body, cached.encoding)
+
+        if self.cache and response.status_code == 200 and \
+                not self._logged_out(response.content):
+            self.cache.store(url, response.content, response.encoding,
+                             response.headers.get('ETag'),
+                             response.headers.get('Last-Modified'))
+        return self._decode(response.content, response.encoding)
+
+    def _logged_out(self, content: bytes) -> bool:
+        """Whether a page was served to an expired session"""
+        return False
+
+    def _renew_session(self):
+        pass
+
+    def _report_proxy(self, proxy: str, status: int, started: float):
+        """Count a response against the proxy only when the site blocked it;
+        a 404 or a 500 is the page's fault, not the proxy's
+        """
+        if status in BLOCK_STATUSES:
+            self.proxies.report_failure(proxy)
+        else:
+            self.proxies.report_success(proxy, time.monotonic() - started)
+
+    @staticmethod
+    def _observe_fetch(host: str, status, started: float):
+        metrics.fetch_seconds.labels(host=host, status=status).observe(
+            time.monotonic() - started
+        )
+
+    @staticmethod
+    def _decode(content: bytes, encoding: str) -> str:
         try:
-            return response.content.decode(response.encoding)
+            return content.decode(encoding or 'utf-8')
         except UnicodeDecodeError:
             return ''
 
@@ -58,7 +182,12 @@ class SessionManager:
 
 
 class BHFSessionManager(SessionManager):
-    def __init__(self, main_page_link):
+    TOKEN_TTL = 60 * 60     # seconds
+    # Answers to a search posted with a stale token or session
+    REJECTED_STATUSES = (400, 403)
+
+    def __init__(self, main_page_link, use_cache=True):
+        super().__init__(use_cache=use_cache)
         self.main_page_link = main_page_link
         self.cookies = {
             "xf_csrf": "dEw01PbIXwb9JX9y",
@@ -73,27 +202,47 @@ class BHFSessionManager(SessionManager):
             "User-Agent": "Mozilla/5.0 (Windows NT 6.3; Win64; x64; rv:79.0) "
                           "Gecko/20100101 Firefox/79.0",
         }
+        # The search form token is read once for every job and term
+        self.search_session = auth_pool.session(
+            ('bhf', main_page_link), self._get_search_credentials,
+            self.TOKEN_TTL
+        )
 
     def request_search(self, search_request: str) -> Response:
-        with Session() as session:
-            session.headers.update(self.headers)
-            main_page_response = session.get(
-                self.main_page_link, cookies=self.cookies)
-            if main_page_response.status_code < 500:
-                main_page = BeautifulSoup(
-                    main_page_response.content, "html.parser"
-                )
-                xfToken = self._find_xfToken(main_page)
-                data = {"keywords": search_request, "_xfToken": xfToken}
-                return session.post(
-                    f"{self.main_page_link}/search/search",
-                    cookies=self.cookies,
-                    data=data
-                )
-            else:
-                raise ServerIsDownException(
-                    f'{self.main_page_link} server is down'
-                )
+        site = urlsplit(self.main_page_link).netloc
+        with metrics.search_seconds.labels(site=site).time():
+            return self._request_search(search_request)
+
+    def _request_search(self, search_request: str) -> Response:
+        cookies, xfToken, login_number = self.search_session.get()
+        response = self._post_search(search_request, cookies, xfToken)
+        if response.status_code in self.REJECTED_STATUSES:
+            self.search_session.expire(login_number)
+            cookies, xfToken, _ = self.search_session.get()
+            response = self._post_search(search_request, cookies, xfToken)
+        return response
+
+    def _post_search(self, search_request: str, cookies: dict,
+                     xfToken: str) -> Response:
+        data = {"keywords": search_request, "_xfToken": xfToken}
+        return http_client.post(
+            f"{self.main_page_link}/search/search",
+            cookies={**self.cookies, **cookies},
+            headers=self.headers,
+            data=data
+        )
+
+    def _get_search_credentials(self):
+        main_page_response = http_client.get(
+            self.main_page_link, cookies=self.cookies, headers=self.headers)
+        if main_page_response.status_code >= 500:
+            raise ServerIsDownException(
+                f'{self.main_page_link} server is down'
+            )
+        main_page = BeautifulSoup(main_page_response.content, "html.parser")
+        # The shared client keeps no cookies between requests
+        return (main_page_response.cookies.get_dict(),
+                self._find_xfToken(main_page))
 
     def _find_xfToken(self, html_page: Tag):
         token = html_page.find("input", {"name": "_xfToken"})
@@ -103,40 +252,67 @@ class BHFSessionManager(SessionManager):
 
 
 class LolzSessionManager(SessionManager):
-    def __init__(self, main_page_link):
-        super().__init__()
+    SESSION_TTL = 6 * 60 * 60   # seconds
+    # Guests get "LoggedOut" pages, expired anti-DDoS cookies a script
+    LOGGED_OUT_PATTERN = re.compile(
+        rb'<html[^>]*class="[^"]*\bLoggedOut\b|/process-\w+\.js'
+    )
+
+    def __init__(self, main_page_link, use_cache=True):
+        super().__init__(use_cache=use_cache)
         self.main_page_link = main_page_link
-        self.authenticate(lolz_login, lolz_password)
+        # One login serves every job until it expires
+        self.login_session = auth_pool.session(
+            ('lolz', main_page_link, lolz_login),
+            lambda: (self.authenticate(lolz_login, lolz_password), None),
+            self.SESSION_TTL
+        )
+        self.cookies, _, self.login_number = self.login_session.get()
 
-    def authenticate(self, login: str, password: str):
-        self.cookies = {
+    def authenticate(self, login: str, password: str) -> dict:
+        cookies = {
             'G_ENABLED_IDPS': 'google',
             'xf_market_currency': 'usd'
         }
-        self._get_df_id()
-        self._get_xf_session(login, password)
-        self._get_xf_user(login, password)
+        cookies['df_id'] = self._get_df_id(cookies)
+        cookies['xf_session'] = self._get_xf_session(login, password,
+                                                     cookies)
+        cookies.update(self._get_xf_user(login, password, cookies))
+        return cookies
+
+    def _logged_out(self, content: bytes) -> bool:
+        return bool(self.LOGGED_OUT_PATTERN.search(content[:65536]))
 
-    def _get_df_id(self):
-        script_resp = self.get('https://lolz.guru/process-qv9ypsgmv9.js')
+    def _renew_session(self):
+        self.login_session.expire(self.login_number)
+        self.cookies, _, self.login_number = self.login_session.get()
+
+    def _get_df_id(self, cookies: dict) -> str:
+        script_resp = self.get('https://lolz.guru/process-qv9ypsgmv9.js',
+                               cookies=cookies)
         script = script_resp.content.decode('utf8')
         secret_str = eval(script[349:524])
-        df_id = base64.b64decode(secret_str).decode()
-        self.cookies['df_id'] = df_id
+        return base64.b64decode(secret_str).decode()
 
-    def _get_xf_session(self, login: str, password: str):
+    def _get_xf_session(self, login: str, password: str,
+                        cookies: dict) -> str:
         resp = self.get('https://lolz.guru/login/login',
+                        cookies=cookies,
                         params={'login': login,
                                 'password': password,
                                 'stopfuckingbrute1337': '1'})
-        self.cookies['xf_session'] = resp.cookies['xf_session']
+        return resp.cookies['xf_session']
 
-    def _get_xf_user(self, login: str, password: str):
+    def _get_xf_user(self, login: str, password: str,
+                     cookies: dict) -> dict:
         resp = self.post('https://lolz.guru/login/login',
+                         cookies=cookies,
                          params={'login': login,
                                  'password': password,
                                  'remember': '1',
                                  'stopfuckingbrute1337': '1'})
-        self.cookies['xf_session'] = resp.cookies.get('xf_session')
-        self.cookies['xf_user'] = resp.cookies.get('xf_user')
-        self.cookies['xf_logged_in'] = '1'
+        return {
+            'xf_session': resp.cookies.get('xf_session'),
+            'xf_user': resp.cookies.get('xf_user'),
+            'xf_logged_in': '1',
+        }
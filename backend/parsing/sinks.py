@@ -0,0 +1,179 @@
+import csv
+import gzip
+import json
+import contextlib
+
+from typing import Iterator, List, Tuple
+from parsing.batch import MessageBatch
+from parsing.dates import to_datetime
+from utils import metrics
+
+
+FORMATS = ('xlsx', 'csv', 'csv.gz', 'jsonl', 'jsonl.gz', 'parquet')
+COLUMNS = ('term', 'date', 'username', 'link', 'text')
+
+
+class TermSheet:
+    """The rows of one search term in a flat, single table sink"""
+
+    def __init__(self, sink: 'FlatSink', term: str):
+        self.sink = sink
+        self.term = term
+
+    def write_messages(self, messages: MessageBatch, link: str) -> int:
+        return self.sink.write_rows(self.term, messages, link)
+
+
+class FlatSink:
+    """Writes the messages of every term to one table with a term column
+
+    Mirrors ExcelDocument, so parse_messages writes to either the same way.
+    """
+
+    def create_sheet(self, title: str, index: int = None) -> TermSheet:
+        return TermSheet(self, title)
+
+    def write_rows(self, term: str, messages: MessageBatch,
+                   link: str) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class CSVSink(FlatSink):
+    def __init__(self, file):
+        self.file = file
+        self.writer = csv.writer(file)
+        self.writer.writerow(COLUMNS)
+
+    def write_rows(self, term: str, messages: MessageBatch,
+                   link: str) -> int:
+        rows = list(text_rows(term, messages, link))
+        self.writer.writerows(rows)
+        return len(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class JSONLinesSink(FlatSink):
+    def __init__(self, file):
+        self.file = file
+
+    def write_rows(self, term: str, messages: MessageBatch,
+                   link: str) -> int:
+        lines = [
+            json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n'
+            for row in text_rows(term, messages, link)
+        ]
+        self.file.writelines(lines)
+        return len(lines)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink(FlatSink):
+    """Buffers rows column by column and writes them out a row group at
+    a time
+    """
+    ROW_GROUP_SIZE = 50000
+
+    def __init__(self, path: str):
+        self.pyarrow = pyarrow = _import_pyarrow()
+        self.schema = pyarrow.schema([
+            ('term', pyarrow.string()),
+            ('date', pyarrow.timestamp('s', tz='UTC')),
+            ('username', pyarrow.string()),
+            ('link', pyarrow.string()),
+            ('text', pyarrow.string()),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.columns: List[list] = [[] for _ in COLUMNS]
+
+    def write_rows(self, term: str, messages: MessageBatch,
+                   link: str) -> int:
+        terms, dates, usernames, links, texts = self.columns
+        rows_written = len(messages)
+        # Dates are epoch seconds, which is what a UTC timestamp column holds
+        terms.extend([term] * rows_written)
+        dates.extend(messages.timestamps)
+        usernames.extend(messages.username(index)
+                         for index in range(rows_written))
+        links.extend([link] * rows_written)
+        texts.extend(messages.texts())
+        if len(terms) >= self.ROW_GROUP_SIZE:
+            self._flush()
+        return rows_written
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+    def _flush(self):
+        if not self.columns[0]:
+            return
+        pyarrow = self.pyarrow
+        self.writer.write_table(
+            pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type)
+                 for column, field in zip(self.columns, self.schema)],
+                schema=self.schema
+            ),
+            row_group_size=self.ROW_GROUP_SIZE
+        )
+        self.columns = [[] for _ in COLUMNS]
+
+
+def text_rows(term: str, messages: MessageBatch,
+              link: str) -> Iterator[Tuple[str, ...]]:
+    for index, text in enumerate(messages.texts()):
+        yield (term, to_datetime(messages.timestamps[index]).isoformat(),
+               messages.username(index), link, text)
+
+
+def _import_pyarrow():
+    # Optional and slow to import, so only loaded for parquet files
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError('parquet format requires the pyarrow package')
+    return pyarrow
+
+
+def _text_file(path: str, compressed: bool):
+    if compressed:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+@contextlib.contextmanager
+def open_sink(path: str, export_format: str = 'xlsx'):
+    """Stream messages to `path` in one of FORMATS
+
+    The flat formats hold every term in one table and keep at most a row
+    group in memory.
+    """
+    if export_format not in FORMATS:
+        raise ValueError(f'Unknown export format "{export_format}"')
+    if export_format == 'xlsx':
+        # openpyxl is slow to import and only needed here
+        from parsing.helpers import excel_document
+        with excel_document(path) as document:
+            yield document
+        return
+
+    table_format, _, compression = export_format.partition('.')
+    if table_format == 'csv':
+        sink = CSVSink(_text_file(path, compression == 'gz'))
+    elif table_format == 'jsonl':
+        sink = JSONLinesSink(_text_file(path, compression == 'gz'))
+    else:
+        sink = ParquetSink(path)
+    try:
+        yield sink
+    finally:
+        with metrics.save_seconds.labels(format=export_format).time():
+            sink.close()
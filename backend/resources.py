@@ -1,7 +1,59 @@
+import json
+from flask import Response, request
 from flask_restful import Resource, reqparse, abort
-from parsing.parse import parse_messages
-from parsing.crawl import BHFCrawler, LolzCrawler
-from parsing.exceptions import ServerIsDownException
+from parsing.progress import Progress
+from parsing.sinks import FORMATS
+from parsing.dates import parse_query_date
+from utils.jobs import job_queue
+from utils.http_cache import http_cache
+from utils.scheduler import request_scheduler
+from utils.proxies import proxy_manager
+from utils.metrics import registry
+
+
+def run_parse_job(crawler_class, search_terms, filename,
+                  one_search_page_only, max_pages, *,
+                  progress: Progress, use_cache: bool, distributed: bool,
+                  local_workers: int, concurrency: int,
+                  index_messages: bool, **options):
+    # The crawling modules take most of the startup time, so they are
+    # imported by the first job (or the warm-up) rather than with the app
+    if distributed:
+        # Every term is a task of its own, so there is no term concurrency
+        from parsing.distributed import parse_messages_distributed
+        pages = parse_messages_distributed(
+            crawler_class, search_terms, filename, one_search_page_only,
+            max_pages, progress=progress, use_cache=use_cache,
+            local_workers=local_workers, index_messages=index_messages,
+            **options
+        )
+        return {'filename': filename, 'pages': pages}
+
+    from parsing.parse import parse_messages
+    crawler = crawler_class(use_cache=use_cache)
+    pages = parse_messages(crawler, search_terms,
+                           filename, one_search_page_only,
+                           max_pages, progress=progress,
+                           concurrency=concurrency,
+                           message_index=_message_index(index_messages),
+                           **options)
+    return {'filename': filename, 'pages': pages}
+
+
+def run_index_export(search_terms, filename, *, progress: Progress,
+                     export_format: str, **filters):
+    from parsing.message_index import message_index
+    messages = message_index.export(search_terms, filename, export_format,
+                                    progress=progress, **filters)
+    return {'filename': filename, 'messages': messages}
+
+
+def _message_index(index_messages: bool):
+    # Crawls add to the index only when the request asks for it
+    if not index_messages:
+        return None
+    from parsing.message_index import message_index
+    return message_index
 
 
 class ParseMessages(Resource):
@@ -13,6 +65,26 @@ class ParseMessages(Resource):
                                  type=bool, default=False, required=False)
         self.parser.add_argument('max_pages', location='json', required=False,
                                  type=int, default=100)
+        self.parser.add_argument('concurrency', location='json',
+                                 required=False, type=int, default=4)
+        self.parser.add_argument('use_cache', location='json',
+                                 required=False, type=bool, default=True)
+        self.parser.add_argument('parse_workers', location='json',
+                                 required=False, type=int, default=0)
+        self.parser.add_argument('incremental', location='json',
+                                 required=False, type=bool, default=False)
+        self.parser.add_argument('format', location='json', required=False,
+                                 choices=FORMATS, default='xlsx')
+        self.parser.add_argument('page_memory_mb', location='json',
+                                 required=False, type=int, default=0)
+        self.parser.add_argument('spill_pages', location='json',
+                                 required=False, type=bool, default=False)
+        self.parser.add_argument('distributed', location='json',
+                                 required=False, type=bool, default=False)
+        self.parser.add_argument('local_workers', location='json',
+                                 required=False, type=int, default=0)
+        self.parser.add_argument('index_messages', location='json',
+                                 required=False, type=bool, default=False)
         self.crawler_class = crawler_class
 
     def post(self):
@@ -22,23 +94,194 @@ class ParseMessages(Resource):
         one_search_page_only = args['one_search_page_only']
         max_pages = args['max_pages']
 
-        try:
-            crawler = self.crawler_class()
-            search_terms = keywords.strip().splitlines()
-            parse_messages(crawler, search_terms,
-                           filename, one_search_page_only,
-                           max_pages)
-        except ServerIsDownException:
-            abort(502, message='The server to be parsed is down')
-        else:
-            return filename, 201
+        search_terms = keywords.strip().splitlines()
+        job = job_queue.submit(run_parse_job, self.crawler_class,
+                               search_terms, filename,
+                               one_search_page_only, max_pages,
+                               use_cache=args['use_cache'],
+                               concurrency=args['concurrency'],
+                               parse_workers=args['parse_workers'],
+                               incremental=args['incremental'],
+                               export_format=args['format'],
+                               distributed=args['distributed'],
+                               local_workers=args['local_workers'],
+                               page_memory_mb=args['page_memory_mb'],
+                               spill_pages=args['spill_pages'],
+                               index_messages=args['index_messages'])
+        return {'job_id': job.id, 'filename': filename}, 202
+
+
+def stream_events(crawler_class, search_terms, one_search_page_only,
+                  max_pages, *, use_cache: bool, index_messages: bool,
+                  **options):
+    from parsing.parse import stream_messages
+    try:
+        crawler = crawler_class(use_cache=use_cache)
+        yield from stream_messages(
+            crawler, search_terms, one_search_page_only, max_pages,
+            message_index=_message_index(index_messages), **options
+        )
+    except Exception as e:
+        # The status line is long sent, so failures end the stream instead
+        yield {'event': 'error', 'error': f'{type(e).__name__}: {e}'}
+
+
+def ndjson_event(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + '\n'
+
+
+def sse_event(event: dict) -> str:
+    return f"event: {event['event']}\n" \
+           f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+class StreamMessages(ParseMessages):
+    """Sends the messages as they are scraped, as NDJSON or, when the
+    client accepts text/event-stream, as server-sent events
+
+    The crawl runs in the request and only as fast as the client reads;
+    disconnecting stops it.
+    """
+    ENCODERS = {
+        'application/x-ndjson': ndjson_event,
+        'text/event-stream': sse_event,
+    }
+
+    def __init__(self, crawler_class):
+        super().__init__(crawler_class)
+        for name in ('filename', 'format', 'distributed', 'local_workers'):
+            self.parser.remove_argument(name)
+
+    def post(self):
+        args = self.parser.parse_args()
+        search_terms = args['keywords'].strip().splitlines()
+        mimetype = request.accept_mimetypes.best_match(
+            list(self.ENCODERS)
+        ) or 'application/x-ndjson'
+        encode = self.ENCODERS[mimetype]
+        events = stream_events(self.crawler_class, search_terms,
+                               args['one_search_page_only'],
+                               args['max_pages'],
+                               use_cache=args['use_cache'],
+                               concurrency=args['concurrency'],
+                               parse_workers=args['parse_workers'],
+                               incremental=args['incremental'],
+                               page_memory_mb=args['page_memory_mb'],
+                               spill_pages=args['spill_pages'],
+                               index_messages=args['index_messages'])
+        return Response(
+            (encode(event) for event in events), mimetype=mimetype,
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
 
 
 class BHFMessages(ParseMessages):
     def __init__(self):
+        from parsing.crawl import BHFCrawler
         super().__init__(BHFCrawler)
 
 
 class LolzMessages(ParseMessages):
     def __init__(self):
+        from parsing.crawl import LolzCrawler
+        super().__init__(LolzCrawler)
+
+
+class BHFMessageStream(StreamMessages):
+    def __init__(self):
+        from parsing.crawl import BHFCrawler
+        super().__init__(BHFCrawler)
+
+
+class LolzMessageStream(StreamMessages):
+    def __init__(self):
+        from parsing.crawl import LolzCrawler
         super().__init__(LolzCrawler)
+
+
+class MessageSearch(Resource):
+    """Answers keyword, author and date queries from the messages indexed
+    by earlier crawls, without going to the sites
+
+    Each line of `keywords` is a search request, as in a parse job. With a
+    filename the matches are exported like a parse job's, in a job of
+    their own; otherwise up to `limit` of them are returned, newest first.
+    """
+    MAX_LIMIT = 10000
+
+    def __init__(self):
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('keywords', location='json', required=False,
+                                 default='')
+        self.parser.add_argument('username', location='json', required=False)
+        self.parser.add_argument('site', location='json', required=False)
+        self.parser.add_argument('since', location='json', required=False,
+                                 type=parse_query_date)
+        self.parser.add_argument('until', location='json', required=False,
+                                 type=parse_query_date)
+        self.parser.add_argument('limit', location='json', required=False,
+                                 type=int, default=100)
+        self.parser.add_argument('filename', location='json', required=False)
+        self.parser.add_argument('format', location='json', required=False,
+                                 choices=FORMATS, default='xlsx')
+
+    def post(self):
+        from parsing.message_index import message_index
+        args = self.parser.parse_args()
+        search_terms = (args['keywords'] or '').strip().splitlines()
+        filters = {name: args[name]
+                   for name in ('username', 'site', 'since', 'until')}
+        if args['filename']:
+            job = job_queue.submit(run_index_export, search_terms,
+                                   args['filename'],
+                                   export_format=args['format'], **filters)
+            return {'job_id': job.id, 'filename': args['filename']}, 202
+        limit = max(0, min(args['limit'], self.MAX_LIMIT))
+        return {'messages': message_index.find(search_terms, limit,
+                                               **filters)}
+
+
+class MessageIndexStats(Resource):
+    def get(self):
+        from parsing.message_index import message_index
+        return message_index.stats()
+
+
+class Jobs(Resource):
+    def get(self):
+        return [job.as_dict() for job in job_queue.jobs()]
+
+
+class JobDetail(Resource):
+    def get(self, job_id):
+        job = job_queue.get(job_id)
+        if not job:
+            abort(404, message=f'Job {job_id} does not exist')
+        return job.as_dict()
+
+    def delete(self, job_id):
+        job = job_queue.cancel(job_id)
+        if not job:
+            abort(404, message=f'Job {job_id} does not exist')
+        return job.as_dict(), 202
+
+
+class CacheStats(Resource):
+    def get(self):
+        return http_cache.stats()
+
+
+class SchedulerStats(Resource):
+    def get(self):
+        return request_scheduler.stats()
+
+
+class ProxyStats(Resource):
+    def get(self):
+        return proxy_manager.stats()
+
+
+class Metrics(Resource):
+    def get(self):
+        return Response(registry.render(),
+                        mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The backend modules import each other from the backend directory
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
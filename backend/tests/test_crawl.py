@@ -0,0 +1,131 @@
+import asyncio
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('secrets_archive')
+
+from parsing.crawl import AsyncCrawler  # noqa: E402
+
+LINKS = [f'https://forum/threads/{number}/' for number in range(100)]
+
+
+class FakeSessionManager:
+    async def afetch(self, url, aiosession):
+        await asyncio.sleep(0)
+        return url, url.encode()
+
+
+def crawler():
+    return AsyncCrawler(session_manager=FakeSessionManager())
+
+
+def queue(links, error=None):
+    async def queue_links(thread_links):
+        for link in links:
+            await thread_links.put(link)
+        if error:
+            raise error
+    return queue_links
+
+
+def run(coroutine):
+    async def with_timeout():
+        return await asyncio.wait_for(coroutine, 5)
+    return asyncio.run(with_timeout())
+
+
+async def collect(pages, limit=None):
+    links = []
+    async for page in pages:
+        links.append(page.link)
+        if len(links) == limit:
+            break
+    return links
+
+
+def test_every_link_fetched():
+    pages = crawler()._fetch_pages(queue(LINKS), None)
+    assert sorted(run(collect(pages))) == sorted(LINKS)
+
+
+def test_producer_error_raised_with_full_queue():
+    async def slow_consumer():
+        pages = crawler()._fetch_pages(
+            queue(LINKS, ValueError('search page')), None
+        )
+        await asyncio.sleep(0.1)
+        return await collect(pages)
+
+    with pytest.raises(ValueError, match='search page'):
+        run(slow_consumer())
+
+
+def test_consumer_leaving_stops_every_task():
+    async def leave_early():
+        running = asyncio.all_tasks()
+        pages = crawler()._fetch_pages(queue(LINKS), None)
+        await collect(pages, limit=3)
+        # Both queues fill up while the consumer is away
+        await asyncio.sleep(0.1)
+        await pages.aclose()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        return asyncio.all_tasks() - running
+
+    assert run(leave_early()) == set()
+
+
+class ThreadSessionManager:
+    """Serves a three page thread, counting the requests for each page"""
+    PAGES = 3
+
+    def __init__(self):
+        self.requests = {}
+
+    def get_page(self, url, revalidate=False):
+        self.requests[url] = self.requests.get(url, 0) + 1
+        page = int(url.rsplit('-', 1)[1])
+        next_page = f'<link rel="next" href="page-{page + 1}">' \
+            if page < self.PAGES else ''
+        return f'<html><head>{next_page}</head><body>{page}</body></html>'
+
+
+def read_thread(crawler, url='https://forum/threads/1/page-1'):
+    """Walk a thread as a term does, scraping every page it is handed"""
+    links = []
+    for page in crawler.get_thread_pages(url):
+        crawler.memo.messages(page.link, page.html, scraped_page)
+        links.append(page.link)
+    return links
+
+
+def scraped_page(html):
+    future = Future()
+    future.set_result(html)
+    return future
+
+
+THREAD = [f'https://forum/threads/1/page-{page}' for page in (1, 2, 3)]
+
+
+def test_second_term_follows_a_thread_read_before():
+    session_manager = ThreadSessionManager()
+    crawler = AsyncCrawler(session_manager=session_manager)
+    assert read_thread(crawler) == THREAD
+    assert read_thread(crawler) == THREAD
+    assert all(count == 1 for count in session_manager.requests.values())
+
+
+def test_thread_followed_from_a_page_fetched_by_a_search():
+    session_manager = ThreadSessionManager()
+    crawler = AsyncCrawler(session_manager=session_manager)
+
+    async def search_fetch():
+        return await crawler.memo.afetch(
+            THREAD[0], lambda: asyncio.sleep(0, (THREAD[0], 'page'))
+        )
+
+    asyncio.run(search_fetch())
+    crawler.memo.messages(THREAD[0], 'page', scraped_page)
+    assert read_thread(crawler) == THREAD
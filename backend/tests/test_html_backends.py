@@ -0,0 +1,105 @@
+"""SoupBackend and LxmlBackend must scrape identical messages"""
+import pytest
+
+from benchmarks import fixtures
+from parsing.html_backends import LxmlBackend, SoupBackend
+from parsing.scrape import BHFScraper, LolzScraper
+
+pytest.importorskip('lxml')
+
+
+BHF_EDGE_CASES = (
+    'one &amp; two &lt;three&gt; "four"',
+    'before<script>if (a < b && c > d) x = "<p>";</script>after',
+    'before<script>1 > 2</script>after',
+    'before<style>p>q { color: red } a<b</style>after',
+    'a<!-- a comment -->b<!-- it > has -->c',
+    'outer<blockquote>quoted<blockquote>twice</blockquote></blockquote>'
+    ' tail',
+    '<b>bold</b> <i>italic <u>nested</u></i> plain',
+    'line<br>break<br/>again',
+    '   spaced   <span>  out  </span>   ',
+    'emoji 🙂 and ёжик Ёж',
+    '',
+)
+LOLZ_EDGE_CASES = (
+    'quoted "words" and &quot;entities&quot;',
+    'a<script>var s = "</p>";</script>b',
+    'x<style>.a > .b {}</style>y',
+    '<a href="/x">link</a> and <img src="y.png"> image',
+)
+
+
+def bhf_page(texts) -> str:
+    return '<html><body>' + ''.join(
+        f'<article class="message message--post">'
+        f'<h4 class="message-name"><a class="username">user{position}</a>'
+        f'</h4><time datetime="2020-08-12T17:41:00+0300"></time>'
+        f'<div class="bbWrapper">{text}</div></article>'
+        for position, text in enumerate(texts)
+    ) + '</body></html>'
+
+
+def lolz_page(texts) -> str:
+    return '<html><body><ol class="messageList">' + ''.join(
+        f'<li class="message" data-author="user{position}">'
+        f'<blockquote class="messageText baseHtml">{text}</blockquote>'
+        f'<abbr class="DateTime">12 авг 2020 в 17:41</abbr></li>'
+        for position, text in enumerate(texts)
+    ) + '</ol></body></html>'
+
+
+def scraped(scraper_class, page: str):
+    messages = scraper_class(SoupBackend()).get_all_messages(page), \
+        scraper_class(LxmlBackend()).get_all_messages(page)
+    return [(list(batch.timestamps),
+             [batch.username(index) for index in range(len(batch))],
+             list(batch.texts()))
+            for batch in messages]
+
+
+@pytest.mark.parametrize('thread_id', range(3))
+def test_bhf_fixture_pages(thread_id):
+    soup, lxml = scraped(BHFScraper, fixtures.bhf_thread_page(thread_id, 1))
+    assert soup == lxml
+    assert len(soup[2]) == fixtures.DEFAULT_CONFIG.messages_per_page
+
+
+@pytest.mark.parametrize('thread_id', range(3))
+def test_lolz_fixture_pages(thread_id):
+    soup, lxml = scraped(LolzScraper, fixtures.lolz_thread_page(thread_id, 1))
+    assert soup == lxml
+    assert len(soup[2]) == fixtures.DEFAULT_CONFIG.messages_per_page
+
+
+@pytest.mark.parametrize('text', BHF_EDGE_CASES)
+def test_bhf_edge_cases(text):
+    soup, lxml = scraped(BHFScraper, bhf_page([text]))
+    assert soup == lxml
+
+
+@pytest.mark.parametrize('text', LOLZ_EDGE_CASES)
+def test_lolz_edge_cases(text):
+    soup, lxml = scraped(LolzScraper, lolz_page([text]))
+    assert soup == lxml
+
+
+def test_script_text_is_not_escaped():
+    soup, lxml = scraped(BHFScraper, bhf_page(['<script>1 > 2</script>']))
+    assert soup[2] == lxml[2] == ['1 > 2']
+
+
+@pytest.mark.parametrize('backend_class', (SoupBackend, LxmlBackend))
+def test_queries(backend_class):
+    backend = backend_class()
+    page = backend.parse(
+        '<div><a class="username username--style2" href="/u">name</a>'
+        '<a class="other">x</a><p class="a b">one</p><p class="ab">two</p>'
+        '</div>'
+    )
+    assert backend.string(backend.find(page, 'a', 'username',
+                                       class_prefix=True)) == 'name'
+    assert backend.attr(backend.find(page, 'a'), 'href') == '/u'
+    assert [backend.full_text(p) for p in backend.find_all(page, 'p', 'a')] \
+        == ['one']
+    assert backend.find(page, 'span') is None
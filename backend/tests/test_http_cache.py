@@ -0,0 +1,42 @@
+from utils.http_cache import HTTPCache
+
+
+def cache(tmp_path, **options):
+    return HTTPCache(str(tmp_path / 'http_cache.sqlite3'), **options)
+
+
+def test_replaced_entries_counted_once(tmp_path):
+    http_cache = cache(tmp_path, max_size=100)
+    for _ in range(5):
+        http_cache.store('https://forum/1', b'x' * 60)
+    assert http_cache.lookup('https://forum/1').body == b'x' * 60
+    assert http_cache.stats()['size'] == 60
+
+
+def test_least_recently_used_evicted(tmp_path):
+    http_cache = cache(tmp_path, max_size=100)
+    http_cache.store('https://forum/1', b'x' * 40)
+    http_cache.store('https://forum/2', b'x' * 40)
+    http_cache.lookup('https://forum/1')
+    http_cache.store('https://forum/3', b'x' * 40)
+    assert http_cache.lookup('https://forum/2') is None
+    assert http_cache.lookup('https://forum/1') is not None
+    assert http_cache.stats()['size'] == 80
+
+
+def test_size_counted_from_existing_file(tmp_path):
+    cache(tmp_path).store('https://forum/1', b'x' * 60)
+    http_cache = cache(tmp_path, max_size=100)
+    http_cache.store('https://forum/2', b'x' * 60)
+    assert http_cache.stats() == {'hits': 0, 'misses': 0, 'revalidated': 0,
+                                  'entries': 1, 'size': 60}
+
+
+def test_stale_entries_need_validators(tmp_path):
+    http_cache = cache(tmp_path, ttl=0)
+    http_cache.store('https://forum/1', b'page')
+    http_cache.store('https://forum/2', b'page', etag='"v1"')
+    assert http_cache.lookup('https://forum/1') is None
+    cached = http_cache.lookup('https://forum/2')
+    assert not cached.fresh
+    assert HTTPCache.validators(cached) == {'If-None-Match': '"v1"'}
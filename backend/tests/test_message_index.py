@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from parsing.batch import MessageBatch
+from parsing.message_index import MessageIndex
+
+
+def batch(*texts):
+    messages = MessageBatch()
+    for position, text in enumerate(texts):
+        messages.append(1600000000 + position, 'user', text)
+    return messages
+
+
+def found(index, term):
+    return [text for _, messages in index.search(term)
+            for text in messages.texts()]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = MessageIndex(str(tmp_path / 'messages.sqlite3'))
+    index.add('forum', 'https://forum/t/1',
+              batch('Down the Rabbit hole', 'a bitcoin wallet',
+                    'ЁЛКА и ёж', 'nothing here'))
+    return index
+
+
+def test_full_text(index):
+    assert index.full_text
+
+
+@pytest.mark.parametrize('term, texts', [
+    ('bit', ['a bitcoin wallet', 'Down the Rabbit hole']),
+    ('BBIT HO', ['Down the Rabbit hole']),
+    ('ёлка', ['ЁЛКА и ёж']),
+    ('ёж', ['ЁЛКА и ёж']),
+    ('coin wal', ['a bitcoin wallet']),
+    ('absent', []),
+])
+def test_search_matches_inside_words(index, term, texts):
+    assert sorted(found(index, term)) == sorted(texts)
+
+
+def test_messages_indexed_once(index):
+    assert index.add('forum', 'https://forum/t/2',
+                     batch('Down the Rabbit hole')) == 0
+    assert found(index, 'rabbit') == ['Down the Rabbit hole']
+
+
+def test_word_index_rebuilt(tmp_path):
+    path = str(tmp_path / 'messages.sqlite3')
+    MessageIndex(path).add('forum', 'https://forum/t/1', batch('rabbit'))
+    with sqlite3.connect(path) as connection:
+        connection.execute('DROP TABLE messages_text')
+        connection.execute(
+            "CREATE VIRTUAL TABLE messages_text USING fts5(text, "
+            "content='messages', content_rowid='id')"
+        )
+    assert found(MessageIndex(path), 'bbi') == ['rabbit']
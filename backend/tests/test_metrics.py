@@ -0,0 +1,42 @@
+import re
+
+from utils.metrics import Counter, Histogram, Registry
+
+SAMPLE_PATTERN = re.compile(r'^(\w+)(\{.*\})? \S+$')
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+
+def rendered():
+    registry = Registry()
+    registry.register(Counter('rows_written', 'Rows', ('format',)))\
+        .labels(format='csv').inc(3)
+    registry.register(Counter('failures', 'Failures')).inc()
+    registry.register(Histogram('fetch_seconds', 'Latency',
+                                buckets=(0.1, 1.0))).observe(0.5)
+    return registry.render().splitlines()
+
+
+def test_samples_named_after_their_family():
+    families = {}
+    for line in rendered():
+        if line.startswith('# TYPE '):
+            _, _, family, metric_type = line.split()
+            families[family] = metric_type
+            continue
+        if line.startswith('#'):
+            continue
+        name = SAMPLE_PATTERN.match(line).group(1)
+        if name not in families:
+            stem = next(name[:-len(suffix)] for suffix in HISTOGRAM_SUFFIXES
+                        if name.endswith(suffix))
+            assert families[stem] == 'histogram'
+    assert families == {'rows_written_total': 'counter',
+                        'failures_total': 'counter',
+                        'fetch_seconds': 'histogram'}
+
+
+def test_counter_samples():
+    lines = rendered()
+    assert 'rows_written_total{format="csv"} 3.0' in lines
+    assert 'failures_total 1.0' in lines
+    assert '# HELP failures_total Failures' in lines
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import types
+
+import pytest
+
+from utils.proxies import FAILURES_TO_TRIP, PROXY_LIST_TTL, ProxyManager
+
+
+class SlowServer:
+    """A search engine server whose pool is only reachable off the loop"""
+
+    def __init__(self, proxies):
+        self.threads = set()
+        self.checks = []
+        self._proxy_pool = iter(proxies)
+
+    def proxy_check(self):
+        self.checks.append(threading.current_thread())
+        self._proxy_pool = iter(['10.0.1.1:8080'])
+
+    @property
+    def proxy_pool(self):
+        self.threads.add(threading.current_thread())
+        return self._proxy_pool
+
+
+def proxies(count):
+    return [f'10.0.0.{number}:8080' for number in range(count)]
+
+
+def test_refilled_from_the_pool():
+    manager = ProxyManager(types.SimpleNamespace(proxy_pool=iter(proxies(3))))
+    assert manager.acquire() in proxies(3)
+    assert manager.stats()['total'] == 3
+
+
+def test_empty_pool_gives_no_proxy():
+    manager = ProxyManager(types.SimpleNamespace(proxy_pool=iter(())))
+    assert manager.acquire() is None
+
+
+def test_async_refill_runs_off_the_loop():
+    server = SlowServer(proxies(30))
+    manager = ProxyManager(server)
+
+    async def acquire():
+        return await asyncio.gather(*[manager.aacquire() for _ in range(10)])
+
+    assert set(asyncio.run(acquire())) <= set(proxies(30))
+    assert server.threads
+    assert threading.main_thread() not in server.threads
+    assert manager.stats()['total'] == 20
+
+
+def test_old_proxy_list_scraped_again_off_the_loop():
+    server = SlowServer(proxies(30))
+    manager = ProxyManager(server)
+
+    async def acquire():
+        return await manager.aacquire()
+
+    asyncio.run(acquire())
+    assert not server.checks
+    manager._list_loaded_at -= PROXY_LIST_TTL
+    asyncio.run(acquire())
+    assert len(server.checks) == 1
+    assert threading.main_thread() not in server.checks
+    assert manager.stats()['total'] == 21
+
+
+@pytest.mark.parametrize('status, failed', [
+    (200, False), (404, False), (500, False),
+    (403, True), (407, True), (429, True), (503, True),
+])
+def test_only_blocks_count_against_the_proxy(status, failed):
+    session_managers = pytest.importorskip('parsing.session_managers')
+    session_manager = session_managers.SessionManager(use_cache=False)
+    session_manager.proxies = ProxyManager(
+        types.SimpleNamespace(proxy_pool=iter(proxies(1)))
+    )
+    proxy = session_manager.proxies.acquire()
+    for _ in range(FAILURES_TO_TRIP):
+        session_manager._report_proxy(proxy, status, 0.0)
+    health, = session_manager.proxies.stats()['proxies']
+    assert health['available'] is not failed
+    assert (health['failure_rate'] > 0) is failed
@@ -0,0 +1,74 @@
+import time
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from benchmarks.server import ForumServer  # noqa: E402
+from utils.scheduler import RequestScheduler, is_throttled  # noqa: E402
+
+START_RATE = 16.0
+
+
+def crawl(server, requests, scheduler):
+    """Fetch a thread page `requests` times through the scheduler; the
+    host's rate after each response and when each request was admitted
+    """
+    url = f'{server.url}/threads/1/'
+
+    async def run():
+        rates, admitted = [], []
+        async with aiohttp.ClientSession() as session:
+            for _ in range(requests):
+                async with scheduler.slot(url):
+                    admitted.append(time.monotonic())
+                    async with session.get(url) as response:
+                        body = await response.read()
+                scheduler.feedback(url, response.status, response.headers,
+                                   body)
+                rates.append(scheduler._host(url).rate)
+        return rates, admitted
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def scheduler():
+    return RequestScheduler()
+
+
+def throttling_server(status, retry_after=None):
+    return ForumServer('lolz', error_rate=1.0, error_status=status,
+                       retry_after=retry_after)
+
+
+@pytest.mark.parametrize('status', [429, 503, 403])
+def test_rate_shrinks_when_throttled(scheduler, status):
+    with throttling_server(status) as server:
+        scheduler._host(server.url).rate = START_RATE
+        rates, _ = crawl(server, 3, scheduler)
+    assert rates == [START_RATE / 2, START_RATE / 4, START_RATE / 8]
+
+
+def test_retry_after_honoured(scheduler):
+    with throttling_server(429, retry_after=0.5) as server:
+        scheduler._host(server.url).rate = START_RATE
+        _, admitted = crawl(server, 2, scheduler)
+    assert admitted[1] - admitted[0] >= 0.5
+
+
+def test_rate_grows_back(scheduler):
+    with throttling_server(503) as server:
+        scheduler._host(server.url).rate = START_RATE
+        crawl(server, 2, scheduler)
+        server.error_rate = 0.0
+        rates, _ = crawl(server, 8, scheduler)
+    assert rates[0] == START_RATE / 4 + 0.25
+    assert rates == sorted(rates)
+    assert rates[-1] == START_RATE / 4 + 2
+
+
+def test_server_errors_are_not_throttling():
+    assert not is_throttled(500, {}, b'Synthetic error')
+    assert not is_throttled(403, {}, b'Forbidden')
@@ -0,0 +1,144 @@
+import time
+import types
+import asyncio
+import threading
+
+import pytest
+
+from benchmarks import fixtures
+
+pytest.importorskip('secrets_archive')
+
+from parsing.html_backends import SoupBackend  # noqa: E402
+from parsing import serp  # noqa: E402
+from parsing.serp import (  # noqa: E402
+    SEARCH_DEADLINE, BingSearch, FederatedSearch, SearchEngine, normalize_url
+)
+
+
+SITE_URL = 'https://lolz.guru'
+
+
+def test_bing_results_are_the_result_headings_only():
+    search = BingSearch(backend=SoupBackend(), user_agents=['test'])
+    results_page = search.parse_results_page(
+        fixtures.lolz_search_page(1, site_url=SITE_URL)
+    )
+    threads = fixtures.DEFAULT_CONFIG.threads_per_search_page
+    assert results_page.links == [f'{SITE_URL}/threads/{thread_id}/'
+                                  for thread_id in range(threads)]
+    assert results_page.next_url == 'https://www.bing.com/search?page=2'
+
+
+def test_blocked_bing_page_has_no_results():
+    # What Bing serves a blocked client: its usual links, no results
+    search = BingSearch(backend=SoupBackend(), user_agents=['test'])
+    results_page = search.parse_results_page(
+        f'<html><body>{fixtures.BING_NAVIGATION}<div>Verify you are a '
+        f'human</div>{fixtures.BING_FOOTER}</body></html>'
+    )
+    assert results_page == ([], None)
+
+
+def test_normalize_url():
+    assert normalize_url('HTTPS://Lolz.Guru:443/threads/1/?utm_source=x'
+                         '&page=2#post-5') == \
+        'https://lolz.guru/threads/1/?page=2'
+    assert normalize_url('http://lolz.guru:8080') == 'http://lolz.guru:8080/'
+
+
+class FakeEngine(SearchEngine):
+    """Serves fixed results pages, or fails or stalls after them"""
+
+    def __init__(self, name, results_pages, then=None):
+        super().__init__(user_agents=['test'])
+        self.name = name
+        self.results_pages = results_pages
+        self.then = then
+        self.pages_read = 0
+
+    async def pages(self, query, one_page_only, max_pages):
+        for links in self.results_pages:
+            self.pages_read += 1
+            yield [normalize_url(link) for link in links]
+        if self.then == 'fail':
+            raise ConnectionError('blocked')
+        if self.then == 'stall':
+            await asyncio.sleep(60)
+
+
+def federated_links(engines, deadline=SEARCH_DEADLINE):
+    async def collect():
+        return [link async for link in
+                FederatedSearch(engines, deadline).search('q', False, 10)]
+    return asyncio.new_event_loop().run_until_complete(collect())
+
+
+def test_federated_search_yields_each_result_once():
+    bing = FakeEngine('bing', [
+        ['https://lolz.guru/threads/1/', 'https://lolz.guru/threads/2/'],
+        ['https://lolz.guru/threads/3/'],
+    ])
+    google = FakeEngine('google', [
+        ['https://LOLZ.guru/threads/2/?utm_source=google',
+         'https://lolz.guru/threads/1/#post-1'],
+        ['https://lolz.guru/threads/4/'],
+    ])
+    assert federated_links([bing, google]) == [
+        'https://lolz.guru/threads/1/', 'https://lolz.guru/threads/2/',
+        'https://lolz.guru/threads/3/',
+    ]
+    # Its first page only had results already found, so it was stopped
+    assert google.pages_read == 1
+
+
+def test_federated_search_outlives_a_failing_engine():
+    failing = FakeEngine('bing', [['https://lolz.guru/threads/1/']], 'fail')
+    working = FakeEngine('google', [['https://lolz.guru/threads/2/']])
+    assert federated_links([failing, working]) == [
+        'https://lolz.guru/threads/1/', 'https://lolz.guru/threads/2/',
+    ]
+
+
+def test_federated_search_stops_at_the_deadline():
+    stalled = FakeEngine('bing', [['https://lolz.guru/threads/1/']], 'stall')
+    started = time.monotonic()
+    assert federated_links([stalled], deadline=0.2) == [
+        'https://lolz.guru/threads/1/'
+    ]
+    assert time.monotonic() - started < 5
+
+
+def test_slow_consumer_gets_every_link_found_by_the_deadline():
+    found = [f'https://lolz.guru/threads/{number}/' for number in range(50)]
+    stalled = FakeEngine('bing', [found], 'stall')
+
+    async def consume_slowly():
+        links = []
+        async for link in FederatedSearch([stalled], 0.2).search('q', False,
+                                                                 10):
+            links.append(link)
+            await asyncio.sleep(0.01)
+        return links
+
+    assert asyncio.new_event_loop().run_until_complete(consume_slowly()) \
+        == found
+
+
+def test_user_agents_loaded_off_the_loop(monkeypatch):
+    threads = []
+
+    def get_server():
+        threads.append(threading.current_thread())
+        return types.SimpleNamespace(user_agents=[b'agent'])
+
+    monkeypatch.setattr(serp, 'get_server', get_server)
+    search = BingSearch(backend=SoupBackend())
+
+    async def user_agents():
+        return await asyncio.gather(search._user_agent(),
+                                    search._user_agent())
+
+    agents = asyncio.new_event_loop().run_until_complete(user_agents())
+    assert agents == ['agent', 'agent']
+    assert threads and threading.main_thread() not in threads
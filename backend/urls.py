@@ -11,7 +11,17 @@ APIResource = namedtuple('APIResource', ('resource', 'endpoint'))
 
 urlpatterns: List[APIResource] = [
     APIResource(resources.BHFMessages, '/messages/bhf'),
-    APIResource(resources.LolzMessages, '/messages/lolz')
+    APIResource(resources.LolzMessages, '/messages/lolz'),
+    APIResource(resources.BHFMessageStream, '/messages/bhf/stream'),
+    APIResource(resources.LolzMessageStream, '/messages/lolz/stream'),
+    APIResource(resources.MessageSearch, '/messages/search'),
+    APIResource(resources.MessageIndexStats, '/messages/index'),
+    APIResource(resources.Jobs, '/jobs'),
+    APIResource(resources.JobDetail, '/jobs/<string:job_id>'),
+    APIResource(resources.CacheStats, '/cache'),
+    APIResource(resources.SchedulerStats, '/scheduler'),
+    APIResource(resources.ProxyStats, '/proxies'),
+    APIResource(resources.Metrics, '/metrics'),
 ]
 
 
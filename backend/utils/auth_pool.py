@@ -0,0 +1,65 @@
+import time
+import threading
+
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+# What a login returns: cookies and, for sites with forms, a form token
+Credentials = Tuple[Dict[str, str], Optional[str]]
+
+
+class SiteSession:
+    """Cookies and form token of one site account, shared by every session
+    manager of the process
+
+    They are obtained with `login` when first needed, and again once `ttl`
+    seconds have passed or a user reports them expired.
+    """
+
+    def __init__(self, login: Callable[[], Credentials], ttl: float):
+        self.login = login
+        self.ttl = ttl
+        self.logins = 0
+        self._credentials: Credentials = ({}, None)
+        self._logged_in_at = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Tuple[Dict[str, str], Optional[str], int]:
+        """Cookies, token and the number of the login they come from"""
+        with self._lock:
+            if self._expired():
+                self._credentials = self.login()
+                self._logged_in_at = time.monotonic()
+                self.logins += 1
+            cookies, token = self._credentials
+            return dict(cookies), token, self.logins
+
+    def expire(self, login_number: int):
+        """Log in again on next use, unless someone already did after
+        login `login_number`
+        """
+        with self._lock:
+            if login_number == self.logins:
+                self._logged_in_at = None
+
+    def _expired(self) -> bool:
+        return self._logged_in_at is None or \
+            time.monotonic() - self._logged_in_at >= self.ttl
+
+
+class AuthPool:
+    def __init__(self):
+        self._sessions: Dict[Hashable, SiteSession] = {}
+        self._lock = threading.Lock()
+
+    def session(self, key: Hashable, login: Callable[[], Credentials],
+                ttl: float) -> SiteSession:
+        """The session stored under `key`, made with `login` if new"""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = SiteSession(login, ttl)
+            return session
+
+
+auth_pool = AuthPool()
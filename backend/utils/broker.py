@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import contextlib
+from uuid import uuid4
+from collections import namedtuple
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.site_parser',
+                            'broker.sqlite3')
+LEASE_TIME = 60         # seconds
+MAX_ATTEMPTS = 3
+BUSY_TIMEOUT = 30       # seconds
+
+
+class TaskStatus:
+    PENDING = 'pending'
+    LEASED = 'leased'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+
+Task = namedtuple('Task', ('id', 'job_id', 'position', 'payload', 'attempts'))
+
+
+class Broker:
+    """Task queue shared by a job's coordinator and its workers
+
+    Workers lease a task for `lease_time` seconds and renew the lease while
+    they run it. A task whose lease runs out, because its worker died or
+    hung, goes back to the queue until it has been tried `max_attempts`
+    times. Only the first result stored for a task is kept, so a worker
+    finishing a task someone else took over changes nothing.
+    """
+    lease_time = LEASE_TIME
+
+    def put(self, job_id: str, payloads: List[dict]) -> List[str]:
+        """Queue one task per payload, positioned in list order"""
+        raise NotImplementedError
+
+    def lease(self, worker: str) -> Optional[Task]:
+        raise NotImplementedError
+
+    def renew(self, task_id: str, worker: str) -> bool:
+        """Extend a lease; False once the task is no longer the worker's"""
+        raise NotImplementedError
+
+    def complete(self, task_id: str, worker: str, result: bytes):
+        raise NotImplementedError
+
+    def fail(self, task_id: str, worker: str, error: str):
+        raise NotImplementedError
+
+    def cancel(self, job_id: str):
+        raise NotImplementedError
+
+    def counts(self, job_id: str) -> Dict[str, int]:
+        """Number of the job's tasks in each TaskStatus"""
+        raise NotImplementedError
+
+    def results(self, job_id: str) -> Iterator[Tuple[int, bytes]]:
+        """Positions and results of the job's done tasks, in order"""
+        raise NotImplementedError
+
+    def errors(self, job_id: str) -> Dict[int, str]:
+        """Last error of each of the job's failed tasks, by position"""
+        raise NotImplementedError
+
+    def forget(self, job_id: str):
+        raise NotImplementedError
+
+
+class SQLiteBroker(Broker):
+    """Broker in an SQLite file, for workers on this machine or sharing its
+    file system
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH,
+                 lease_time: float = LEASE_TIME,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def put(self, job_id: str, payloads: List[dict]) -> List[str]:
+        task_ids = [uuid4().hex for _ in payloads]
+        now = time.time()
+        with self._transaction() as db:
+            db.executemany(
+                'INSERT INTO tasks (id, job_id, position, payload, status, '
+                'created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(task_id, job_id, position, json.dumps(payload),
+                  TaskStatus.PENDING, now)
+                 for position, (task_id, payload)
+                 in enumerate(zip(task_ids, payloads))]
+            )
+        return task_ids
+
+    def lease(self, worker: str) -> Optional[Task]:
+        now = time.time()
+        with self._transaction() as db:
+            self._requeue_expired(db, now)
+            row = db.execute(
+                'SELECT id, job_id, position, payload, attempts FROM tasks '
+                'WHERE status = ? ORDER BY created_at, position LIMIT 1',
+                (TaskStatus.PENDING,)
+            ).fetchone()
+            if row is None:
+                return None
+            task_id, job_id, position, payload, attempts = row
+            db.execute(
+                'UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, '
+                'attempts = attempts + 1 WHERE id = ?',
+                (TaskStatus.LEASED, worker, now + self.lease_time, task_id)
+            )
+        return Task(task_id, job_id, position, json.loads(payload),
+                    attempts + 1)
+
+    def renew(self, task_id: str, worker: str) -> bool:
+        with self._transaction() as db:
+            updated = db.execute(
+                'UPDATE tasks SET lease_expires = ? '
+                'WHERE id = ? AND worker = ? AND status = ?',
+                (time.time() + self.lease_time, task_id, worker,
+                 TaskStatus.LEASED)
+            ).rowcount
+        return bool(updated)
+
+    def complete(self, task_id: str, worker: str, result: bytes):
+        with self._transaction() as db:
+            status = db.execute('SELECT status FROM tasks WHERE id = ?',
+                                (task_id,)).fetchone()
+            if status is None or status[0] == TaskStatus.CANCELLED:
+                return
+            db.execute(
+                'INSERT OR IGNORE INTO results (task_id, worker, result, '
+                'finished_at) VALUES (?, ?, ?, ?)',
+                (task_id, worker, result, time.time())
+            )
+            db.execute(
+                'UPDATE tasks SET status = ?, lease_expires = NULL '
+                'WHERE id = ?', (TaskStatus.DONE, task_id)
+            )
+
+    def fail(self, task_id: str, worker: str, error: str):
+        with self._transaction() as db:
+            db.execute(
+                'UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? '
+                'ELSE ? END, error = ?, worker = NULL, lease_expires = NULL '
+                'WHERE id = ? AND worker = ? AND status = ?',
+                (self.max_attempts, TaskStatus.FAILED, TaskStatus.PENDING,
+                 error, task_id, worker, TaskStatus.LEASED)
+            )
+
+    def cancel(self, job_id: str):
+        with self._transaction() as db:
+            db.execute(
+                'UPDATE tasks SET status = ? '
+                'WHERE job_id = ? AND status IN (?, ?)',
+                (TaskStatus.CANCELLED, job_id, TaskStatus.PENDING,
+                 TaskStatus.LEASED)
+            )
+
+    def counts(self, job_id: str) -> Dict[str, int]:
+        with self._transaction() as db:
+            self._requeue_expired(db, time.time())
+            rows = db.execute(
+                'SELECT status, COUNT(*) FROM tasks WHERE job_id = ? '
+                'GROUP BY status', (job_id,)
+            ).fetchall()
+        counts = dict.fromkeys((TaskStatus.PENDING, TaskStatus.LEASED,
+                                *TaskStatus.FINISHED), 0)
+        counts.update(rows)
+        return counts
+
+    def results(self, job_id: str) -> Iterator[Tuple[int, bytes]]:
+        with self._lock:
+            positions = self._db.execute(
+                'SELECT tasks.position, results.task_id FROM tasks '
+                'JOIN results ON results.task_id = tasks.id '
+                'WHERE tasks.job_id = ? ORDER BY tasks.position', (job_id,)
+            ).fetchall()
+        # One result at a time, as each can hold a term's every message
+        for position, task_id in positions:
+            with self._lock:
+                result, = self._db.execute(
+                    'SELECT result FROM results WHERE task_id = ?',
+                    (task_id,)
+                ).fetchone()
+            yield position, result
+
+    def errors(self, job_id: str) -> Dict[int, str]:
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT position, error FROM tasks '
+                'WHERE job_id = ? AND status = ?',
+                (job_id, TaskStatus.FAILED)
+            ).fetchall()
+        return dict(rows)
+
+    def forget(self, job_id: str):
+        with self._transaction() as db:
+            db.execute(
+                'DELETE FROM results WHERE task_id IN '
+                '(SELECT id FROM tasks WHERE job_id = ?)', (job_id,)
+            )
+            db.execute('DELETE FROM tasks WHERE job_id = ?', (job_id,))
+
+    def _requeue_expired(self, db: sqlite3.Connection, now: float):
+        # The worker holding these is gone; give up after the last attempt
+        db.execute(
+            'UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? '
+            'ELSE ? END, error = ?, worker = NULL, lease_expires = NULL '
+            'WHERE status = ? AND lease_expires < ?',
+            (self.max_attempts, TaskStatus.FAILED, TaskStatus.PENDING,
+             'The worker stopped renewing its lease', TaskStatus.LEASED, now)
+        )
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE takes the write lock up front, so two workers never
+        # lease the same task
+        with self._lock:
+            db = self._db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Left in the default rollback journal mode: WAL needs shared
+            # memory, which workers on other machines do not have
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS tasks ('
+                'id TEXT PRIMARY KEY, job_id TEXT, position INTEGER, '
+                'payload TEXT, status TEXT, attempts INTEGER DEFAULT 0, '
+                'worker TEXT, lease_expires REAL, error TEXT, '
+                'created_at REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS tasks_status '
+                'ON tasks (status, created_at, position)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'task_id TEXT PRIMARY KEY, worker TEXT, result BLOB, '
+                'finished_at REAL)'
+            )
+            self._connection = connection
+        return self._connection
+
+
+broker = SQLiteBroker()
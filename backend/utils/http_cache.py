@@ -0,0 +1,168 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+
+from typing import Optional
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.site_parser',
+                            'http_cache.sqlite3')
+# Both can be set for the app with SITE_PARSER_CACHE_TTL (seconds) and
+# SITE_PARSER_CACHE_MAX_MB
+DEFAULT_TTL = int(os.environ.get('SITE_PARSER_CACHE_TTL', 24 * 60 * 60))
+DEFAULT_MAX_SIZE = int(os.environ.get('SITE_PARSER_CACHE_MAX_MB', 512)) \
+    * 1024 * 1024                       # bytes
+
+
+CachedResponse = namedtuple(
+    'CachedResponse',
+    ('body', 'encoding', 'etag', 'last_modified', 'fresh')
+)
+
+
+class HTTPCache:
+    """On-disk response cache keyed by URL
+
+    Entries younger than `ttl` are served as they are, older ones are
+    revalidated with their ETag/Last-Modified when the site sent any. Least
+    recently used entries are evicted once bodies exceed `max_size` bytes.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, ttl: int = DEFAULT_TTL,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        # Size of the bodies as this process last knew it
+        self._size = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT body, encoding, etag, last_modified, fetched_at '
+                'FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            body, encoding, etag, last_modified, fetched_at = row
+            fresh = time.time() - fetched_at < self.ttl
+            if fresh:
+                self.hits += 1
+                self._db.execute(
+                    'UPDATE responses SET accessed_at = ? WHERE url = ?',
+                    (time.time(), url)
+                )
+                self._db.commit()
+            elif not (etag or last_modified):
+                self.misses += 1
+                return None
+            return CachedResponse(body, encoding, etag, last_modified, fresh)
+
+    def store(self, url: str, body: bytes, encoding: str = None,
+              etag: str = None, last_modified: str = None):
+        now = time.time()
+        with self._lock:
+            replaced = self._db.execute(
+                'SELECT size FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            self._size += len(body) - (replaced[0] if replaced else 0)
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses (url, body, encoding, etag, '
+                'last_modified, size, fetched_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, body, encoding, etag, last_modified,
+                 len(body), now, now)
+            )
+            if self._size > self.max_size:
+                self._evict()
+            self._db.commit()
+
+    def refresh(self, url: str):
+        """Mark a stale entry fresh after the server answered 304"""
+        now = time.time()
+        with self._lock:
+            self.revalidated += 1
+            self._db.execute(
+                'UPDATE responses SET fetched_at = ?, accessed_at = ? '
+                'WHERE url = ?', (now, now, url)
+            )
+            self._db.commit()
+
+    @staticmethod
+    def validators(cached: Optional[CachedResponse]) -> dict:
+        """Conditional request headers for a stale entry"""
+        headers = {}
+        if cached and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+        return headers
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+            'entries': entries,
+            'size': size,
+        }
+
+    def _evict(self):
+        # Other processes store into the file too, so the running size is
+        # only trusted to tell when to count again
+        size = self._total_size()
+        if size <= self.max_size:
+            self._size = size
+            return
+        rows = self._db.execute(
+            'SELECT url, size FROM responses ORDER BY accessed_at'
+        )
+        evicted = []
+        for url, entry_size in rows:
+            if size <= self.max_size:
+                break
+            evicted.append((url,))
+            size -= entry_size
+        self._db.executemany('DELETE FROM responses WHERE url = ?', evicted)
+        self._size = size
+
+    def _total_size(self) -> int:
+        size, = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses'
+        ).fetchone()
+        return size
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'url TEXT PRIMARY KEY, body BLOB, encoding TEXT, etag TEXT, '
+                'last_modified TEXT, size INTEGER, fetched_at REAL, '
+                'accessed_at REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS responses_accessed_at '
+                'ON responses (accessed_at)'
+            )
+            self._connection = connection
+            self._size = self._total_size()
+        return self._connection
+
+
+http_cache = HTTPCache()
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import aiohttp
+import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+
+from typing import AsyncIterator, Coroutine, Iterator
+
+
+MAX_CONNECTIONS = 100
+MAX_CONNECTIONS_PER_HOST = 16
+DNS_CACHE_TTL = 300     # seconds
+CONNECT_TIMEOUT = 10    # seconds
+READ_TIMEOUT = 30       # seconds
+
+
+_EXHAUSTED = object()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide requests session keeping connections alive per host
+
+    Cookies the servers set are not stored on the session, so callers
+    sharing it keep passing their own cookies with each request.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_CONNECTIONS,
+                                  pool_maxsize=MAX_CONNECTIONS_PER_HOST)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            _session = session
+    return _session
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().get(url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().post(url, **kwargs)
+
+
+class AsyncHTTPClient:
+    """A single aiohttp session living on a background event loop
+
+    Coroutines from any thread are run on that loop with `run`, so every
+    async fetch shares one connection pool and DNS cache.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def run(self, coro: Coroutine):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """Drive an async generator on the client's loop, yielding its items
+        to the calling thread
+        """
+        try:
+            while True:
+                item = self.run(self._next(agen))
+                if item is _EXHAUSTED:
+                    return
+                yield item
+        finally:
+            self.run(agen.aclose())
+
+    @staticmethod
+    async def _next(agen: AsyncIterator):
+        try:
+            return await agen.__anext__()
+        except StopAsyncIteration:
+            return _EXHAUSTED
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever,
+                                 name='http-client', daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Must be awaited on the client's loop"""
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=MAX_CONNECTIONS,
+                limit_per_host=MAX_CONNECTIONS_PER_HOST,
+                ttl_dns_cache=DNS_CACHE_TTL
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT,
+                                              sock_read=READ_TIMEOUT),
+                cookie_jar=aiohttp.DummyCookieJar()
+            )
+        return self._session
+
+
+async_client = AsyncHTTPClient()
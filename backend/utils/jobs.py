@@ -0,0 +1,124 @@
+import time
+import threading
+from uuid import uuid4
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from parsing.progress import Progress
+from parsing.exceptions import JobCancelledException
+
+from typing import Callable, Dict, List, Optional
+
+
+class JobStatus:
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    def __init__(self, func: Callable, *args, **kwargs):
+        self.id = uuid4().hex
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = JobStatus.PENDING
+        self.progress = Progress()
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in JobStatus.FINISHED
+
+    def run(self):
+        if self.progress.cancelled:
+            self._finish(JobStatus.CANCELLED)
+            return
+
+        self.status = JobStatus.RUNNING
+        self.started_at = time.time()
+        try:
+            self.result = self.func(*self.args, progress=self.progress,
+                                    **self.kwargs)
+        except JobCancelledException:
+            self._finish(JobStatus.CANCELLED)
+        except Exception as e:
+            self.error = f'{type(e).__name__}: {e}'
+            self._finish(JobStatus.FAILED)
+        else:
+            self._finish(JobStatus.DONE)
+
+    def cancel(self):
+        self.progress.cancel()
+        if self.status == JobStatus.PENDING:
+            self._finish(JobStatus.CANCELLED)
+
+    def _finish(self, status: str):
+        self.status = status
+        self.finished_at = time.time()
+
+    def as_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'progress': self.progress.as_dict(),
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """Runs jobs on a bounded pool of worker threads
+
+    Job functions receive a `progress` keyword argument they should report
+    to and check for cancellation.
+    """
+
+    def __init__(self, max_workers: int = 4, max_finished_jobs: int = 100):
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='job')
+        self._jobs: Dict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable, *args, **kwargs) -> Job:
+        job = Job(func, *args, **kwargs)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+        self._executor.submit(job.run)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job:
+            job.cancel()
+        return job
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _forget_finished_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.finished]
+        for job_id in finished[:-self.max_finished_jobs or None]:
+            del self._jobs[job_id]
+
+
+job_queue = JobQueue()
@@ -0,0 +1,192 @@
+import time
+import threading
+import contextlib
+from bisect import bisect_left
+
+from typing import Dict, List, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"')\
+        .replace('\n', r'\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"'
+                     for name, value in labels.items())
+    return '{' + pairs + '}'
+
+
+class Metric:
+    """A family of samples, one per combination of label values"""
+    type = None
+    # Added to the name to make the family's one, as counters need
+    suffix = ''
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children = {}
+        self._lock = threading.Lock()
+        if not labelnames:
+            # Unlabelled metrics are exported even before they change
+            self.labels()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._child()
+        return child
+
+    def render(self) -> List[str]:
+        family = self.name + self.suffix
+        lines = [f'# HELP {family} {self.documentation}',
+                 f'# TYPE {family} {self.type}']
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in sorted(children):
+            lines.extend(child.render(family,
+                                      dict(zip(self.labelnames, key))))
+        return lines
+
+    def _child(self):
+        raise NotImplementedError
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name: str, labels: Dict[str, str]) -> List[str]:
+        return [f'{name}{_format_labels(labels)} {self.value}']
+
+
+class Counter(Metric):
+    type = 'counter'
+    suffix = '_total'
+
+    def inc(self, amount: float = 1):
+        """Increase the unlabelled counter"""
+        self.labels().inc(amount)
+
+    def _child(self):
+        return _CounterValue()
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, name: str, labels: Dict[str, str]) -> List[str]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), counts):
+            cumulative += count
+            bucket_labels = _format_labels({**labels, 'le': str(bound)})
+            lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        return lines
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float):
+        """Record a value of the unlabelled histogram"""
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+
+class Registry:
+    """Metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self._metrics
+                         for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+fetch_seconds = registry.register(Histogram(
+    'site_parser_fetch_seconds', 'Page request latency',
+    ('host', 'status')
+))
+fetch_retries = registry.register(Counter(
+    'site_parser_fetch_retries', 'Page requests repeated after a failure',
+    ('host',)
+))
+proxy_failures = registry.register(Counter(
+    'site_parser_proxy_failures', 'Requests failed through a proxy'
+))
+search_seconds = registry.register(Histogram(
+    'site_parser_search_seconds', 'Site search request latency', ('site',)
+))
+parse_seconds = registry.register(Histogram(
+    'site_parser_parse_seconds', 'Time spent scraping a page',
+    ('scraper',)
+))
+rows_written = registry.register(Counter(
+    'site_parser_rows_written', 'Message rows written', ('format',)
+))
+save_seconds = registry.register(Histogram(
+    'site_parser_save_seconds', 'Time spent finishing an export file',
+    ('format',)
+))
+messages_indexed = registry.register(Counter(
+    'site_parser_messages_indexed', 'Messages added to the message index'
+))
+index_query_seconds = registry.register(Histogram(
+    'site_parser_index_query_seconds', 'Message index query latency'
+))
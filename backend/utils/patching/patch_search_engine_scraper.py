@@ -1,19 +1,16 @@
 import os
-import time
 import random
-import requests
-import search_engine_scraper
-from search_engine_scraper import (
-    serve_search_engines, server, PROXY_USAGE_TIMEOUT
-)
 
 
 def patch_serve_search_engines():
+    """Must run right after search_engine_scraper is first imported"""
     _patch_load_user_agents()
-    _patch_get_page()
 
 
 def _patch_load_user_agents():
+    import search_engine_scraper
+    from search_engine_scraper import serve_search_engines, server
+
     def load_user_agents(self, uafile: str):
         """
         Get User-Agents from a file
@@ -37,42 +34,5 @@ def _patch_load_user_agents():
     server.user_agents = server.load_user_agents(uafile=user_agents_filename)
 
 
-def _patch_get_page():
-    def get_page(self, url: str):
-        """
-        'Gets' the specified URL through requests
-        Checks if proxies are being used for 15 minutes, if so it fetches
-        20 new proxies. proxy_pool provides a pool of proxies through which
-        requests are to be made
-
-        """
-        self.new_proxy_time = time.time()
-        if self.new_proxy_time-self.old_proxy_time >= PROXY_USAGE_TIMEOUT:
-            self.proxy_check()
-        else:
-            self.proxy_pool = self.proxy_pool
-
-        for i in range(1, 21):
-            try:
-                proxy = next(self.proxy_pool)
-                ua = random.choice(self.user_agents)
-                headers = {
-                    "Connection": "close",
-                    "User-Agent": ua
-                }
-                page = requests.get(
-                    url, proxies={"http": proxy}, headers=headers
-                )
-                if page.status_code == 200:
-                    break
-            except Exception:
-                # Skip if chosen proxy failed
-                page = None
-        return page
-
-    serve_search_engines.get_page = get_page
-    bind(server, get_page, 'get_page')
-
-
 def bind(instance, func, as_name):
     setattr(instance, as_name, func.__get__(instance, instance.__class__))
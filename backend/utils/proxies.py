@@ -0,0 +1,199 @@
+import time
+import random
+import asyncio
+import threading
+from utils import metrics
+from utils.search_engines import get_server
+
+from typing import Dict, List, Optional
+
+
+LATENCY_SMOOTHING = 0.3     # weight of the newest sample in the latency EWMA
+FAILURE_SMOOTHING = 0.2     # weight of the newest outcome in the failure rate
+DEFAULT_LATENCY = 1.0       # seconds, assumed for proxies not tried yet
+FAILURES_TO_TRIP = 3        # consecutive failures opening a proxy's circuit
+COOLDOWN = 30               # seconds, doubled on every following trip
+MAX_COOLDOWN = 15 * 60
+MIN_AVAILABLE = 5           # fewer available proxies make the pool grow
+REFILL_SIZE = 20
+# The search engine scraper's PROXY_USAGE_TIMEOUT: its list is scraped
+# again once it is this old
+PROXY_LIST_TTL = 15 * 60    # seconds
+# Responses blaming the proxy rather than the page: the site refuses or
+# rate limits the proxy's address, or the proxy wants credentials
+BLOCK_STATUSES = (403, 407, 429, 503)
+
+
+class ProxyHealth:
+    def __init__(self, proxy: str):
+        self.proxy = proxy
+        self.latency = DEFAULT_LATENCY
+        self.failure_rate = 0.0
+        self.requests = 0
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return now >= self.open_until
+
+    @property
+    def score(self) -> float:
+        """Expected cost of a request through the proxy, lower is better"""
+        return self.latency / max(1 - self.failure_rate, 0.05)
+
+    def succeeded(self, latency: float):
+        self.requests += 1
+        self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+        self.failure_rate -= FAILURE_SMOOTHING * self.failure_rate
+        self.consecutive_failures = 0
+        self.trips = 0
+
+    def failed(self, now: float):
+        self.requests += 1
+        self.failure_rate += FAILURE_SMOOTHING * (1 - self.failure_rate)
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= FAILURES_TO_TRIP:
+            cooldown = min(COOLDOWN * 2 ** self.trips, MAX_COOLDOWN)
+            self.open_until = now + cooldown
+            self.trips += 1
+            # One request is let through once the cooldown is over
+            self.consecutive_failures = FAILURES_TO_TRIP - 1
+
+    def as_dict(self, now: float) -> dict:
+        return {
+            'proxy': self.proxy,
+            'latency': round(self.latency, 3),
+            'failure_rate': round(self.failure_rate, 3),
+            'requests': self.requests,
+            'available': self.available(now),
+            'cooldown_left': round(max(self.open_until - now, 0), 1),
+        }
+
+
+class ProxyManager:
+    """Picks proxies from the search engine server's pool by health
+
+    Proxies are pulled from the server's cycling pool as needed, the
+    search engine scraper's one unless another is given. Each one
+    keeps a latency EWMA and a failure rate; repeated failures take it out
+    of rotation for a growing cooldown. Only plain, short critical
+    sections are used, so threads and coroutines can share one manager;
+    coroutines use `aacquire`, which pulls new proxies in a thread.
+    """
+
+    def __init__(self, server=None):
+        self._server = server
+        self._proxies: Dict[str, ProxyHealth] = {}
+        self._lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._list_loaded_at = None
+
+    def acquire(self) -> Optional[str]:
+        if self._needs_refill():
+            self.refill()
+        return self._pick()
+
+    async def aacquire(self) -> Optional[str]:
+        if self._needs_refill():
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.refill)
+        return self._pick()
+
+    def refill(self):
+        """Pull more proxies from the server's pool, having the server scrape
+        a new list first once its one is old
+
+        Getting the server can import the search engine scraper and fetch
+        its proxy list, so it is done outside the lock the pickers take.
+        """
+        with self._refill_lock:
+            if not self._needs_refill():
+                return
+            self._refresh_list()
+            proxies = []
+            for _ in range(REFILL_SIZE):
+                try:
+                    proxies.append(next(self.server.proxy_pool))
+                except (StopIteration, TypeError):
+                    break
+            with self._lock:
+                for proxy in proxies:
+                    if proxy not in self._proxies:
+                        self._proxies[proxy] = ProxyHealth(proxy)
+
+    def _needs_refill(self) -> bool:
+        with self._lock:
+            return len(self._available(time.monotonic())) < MIN_AVAILABLE \
+                or self._list_expired()
+
+    def _refresh_list(self):
+        server = self.server
+        if self._list_loaded_at is None:
+            # Loaded as the server was built
+            self._list_loaded_at = time.monotonic()
+        elif self._list_expired():
+            self._list_loaded_at = time.monotonic()
+            proxy_check = getattr(server, 'proxy_check', None)
+            if proxy_check:
+                proxy_check()
+
+    def _list_expired(self) -> bool:
+        return self._list_loaded_at is not None and \
+            time.monotonic() - self._list_loaded_at >= PROXY_LIST_TTL
+
+    def _pick(self) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            available = self._available(now)
+            if not available:
+                if not self._proxies:
+                    return None
+                # Everything is cooling down, try the one closest to return
+                return min(self._proxies.values(),
+                           key=lambda health: health.open_until).proxy
+            # The better of two random picks spreads load over fast proxies
+            first, second = random.choice(available), random.choice(available)
+            return min(first, second, key=lambda health: health.score).proxy
+
+    def report_success(self, proxy: Optional[str], latency: float):
+        with self._lock:
+            health = self._proxies.get(proxy)
+            if health:
+                health.succeeded(latency)
+
+    def report_failure(self, proxy: Optional[str]):
+        metrics.proxy_failures.inc()
+        with self._lock:
+            health = self._proxies.get(proxy)
+            if health:
+                health.failed(time.monotonic())
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            proxies = sorted(self._proxies.values(),
+                             key=lambda health: health.score)
+            return {
+                'total': len(proxies),
+                'available': len(self._available(now)),
+                'proxies': [health.as_dict(now) for health in proxies],
+            }
+
+    @property
+    def server(self):
+        return self._server if self._server is not None else get_server()
+
+    @staticmethod
+    def url(proxy: Optional[str]) -> Optional[str]:
+        """aiohttp wants proxies as URLs, the pool stores host:port"""
+        if proxy and '://' not in proxy:
+            return f'http://{proxy}'
+        return proxy
+
+    def _available(self, now: float) -> List[ProxyHealth]:
+        return [health for health in self._proxies.values()
+                if health.available(now)]
+
+
+proxy_manager = ProxyManager()
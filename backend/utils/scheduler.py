@@ -0,0 +1,185 @@
+import re
+import time
+import asyncio
+import threading
+import contextlib
+from collections import deque
+from urllib.parse import urlsplit
+
+from typing import Mapping, Optional
+
+
+MAX_CONCURRENCY = 64
+MAX_CONCURRENCY_PER_HOST = 8
+INITIAL_RATE = 4.0          # requests per second per host
+MIN_RATE = 0.2
+MAX_RATE = 20.0
+RATE_INCREASE = 0.25        # added to the rate after every success
+RATE_DECREASE = 0.5         # the rate is multiplied by it when throttled
+THROUGHPUT_WINDOW = 60      # seconds
+
+THROTTLE_STATUSES = (429, 503)
+CHALLENGE_PATTERN = re.compile(
+    rb'cf-browser-verification|jschl[-_]|cf_chl_|Checking your browser'
+)
+
+
+def is_throttled(status: int, headers: Mapping, body: bytes) -> bool:
+    """Tell rate limiting and Cloudflare challenge pages from real ones"""
+    if status in THROTTLE_STATUSES:
+        return True
+    if headers.get('cf-mitigated') == 'challenge':
+        return True
+    return status == 403 and bool(CHALLENGE_PATTERN.search(body[:65536]))
+
+
+class HostLimiter:
+    """Concurrency cap plus an AIMD-tuned token bucket for one host"""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY_PER_HOST,
+                 rate: float = INITIAL_RATE):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.tokens = 1.0
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._slots = asyncio.Condition()
+        self._completed = deque()
+        self._completed_lock = threading.Lock()
+
+    async def acquire(self):
+        async with self._slots:
+            await self._slots.wait_for(
+                lambda: self.in_flight < self.max_concurrency
+            )
+            self.in_flight += 1
+        try:
+            await self._take_token()
+        except BaseException:
+            await self.release()
+            raise
+
+    async def release(self):
+        async with self._slots:
+            self.in_flight -= 1
+            self._slots.notify()
+
+    def on_success(self):
+        self.requests += 1
+        self.rate = min(MAX_RATE, self.rate + RATE_INCREASE)
+        self._record_completion()
+
+    def on_throttled(self, retry_after: float = None):
+        self.requests += 1
+        self.throttled += 1
+        self.rate = max(MIN_RATE, self.rate * RATE_DECREASE)
+        self.tokens = 0.0
+        pause = retry_after if retry_after else 1 / self.rate
+        self._paused_until = max(self._paused_until,
+                                 time.monotonic() + pause)
+        self._record_completion()
+
+    def throughput(self) -> float:
+        """Requests per second completed over the last window"""
+        with self._completed_lock:
+            self._forget_old_completions(time.monotonic())
+            return len(self._completed) / THROUGHPUT_WINDOW
+
+    def stats(self) -> dict:
+        return {
+            'rate': round(self.rate, 2),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'throughput': round(self.throughput(), 2),
+        }
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self.tokens = min(
+                1.0, self.tokens + (now - self._refilled_at) * self.rate
+            )
+            self._refilled_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def _record_completion(self):
+        now = time.monotonic()
+        with self._completed_lock:
+            self._completed.append(now)
+            self._forget_old_completions(now)
+
+    def _forget_old_completions(self, now: float):
+        while self._completed and \
+                now - self._completed[0] > THROUGHPUT_WINDOW:
+            self._completed.popleft()
+
+
+class RequestScheduler:
+    """Admits async requests under global and per-host limits
+
+    All of its coroutines must run on one event loop, the shared async
+    client's one.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._hosts = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url: str):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        host = self._host(url)
+        await host.acquire()
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            await host.release()
+
+    def feedback(self, url: str, status: int, headers: Mapping,
+                 body: bytes) -> bool:
+        """Adjust the host's rate to a response, True if it was throttled"""
+        host = self._host(url)
+        if not is_throttled(status, headers, body):
+            host.on_success()
+            return False
+        host.on_throttled(self._retry_after(headers))
+        return True
+
+    def stats(self) -> dict:
+        hosts = dict(self._hosts)
+        return {
+            'hosts': {name: host.stats() for name, host in hosts.items()},
+            'throughput': round(
+                sum(host.throughput() for host in hosts.values()), 2
+            ),
+        }
+
+    def _host(self, url: str) -> HostLimiter:
+        name = urlsplit(url).netloc
+        host = self._hosts.get(name)
+        if host is None:
+            host = self._hosts[name] = HostLimiter()
+        return host
+
+    @staticmethod
+    def _retry_after(headers: Mapping) -> Optional[float]:
+        try:
+            return float(headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+
+request_scheduler = RequestScheduler()
@@ -0,0 +1,27 @@
+import threading
+from utils.context import no_print
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_server():
+    """The search engine scraper's server, with its proxy pool and user
+    agents
+
+    Importing search_engine_scraper builds the server, which reads the
+    proxy list and may scrape a new one, so it is imported and patched on
+    first use only.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            from utils.patching.patch_search_engine_scraper import (
+                patch_serve_search_engines
+            )
+            with no_print():
+                import search_engine_scraper
+            patch_serve_search_engines()
+            _server = search_engine_scraper.server
+    return _server
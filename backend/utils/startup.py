@@ -0,0 +1,26 @@
+import importlib
+import threading
+from utils.search_engines import get_server
+
+
+# Slow to import, so left out of the app's own imports
+WARM_UP_MODULES = ('parsing.parse', 'parsing.crawl', 'parsing.helpers')
+
+
+def warm_up() -> threading.Thread:
+    """Import the crawling modules and set the search engine scraper up in
+    the background, so the server answers right away and the first job
+    does not wait for them either
+    """
+    def run():
+        for module in WARM_UP_MODULES:
+            importlib.import_module(module)
+        try:
+            get_server()
+        except Exception as e:
+            # Retried by whatever needs the server first
+            print(f'Search engine scraper warm-up failed: {e!r}')
+
+    thread = threading.Thread(target=run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,48 @@
+"""Worker processes running the tasks of distributed parse jobs
+
+Start any number of them, on this machine or on others that see the
+broker file, e.g. on a shared drive with working file locks:
+
+    python worker.py [--broker PATH] [--processes 4]
+    app worker [--broker PATH] [--processes 4]
+"""
+import os
+import argparse
+import multiprocessing
+
+from typing import List
+from utils.broker import DEFAULT_PATH, SQLiteBroker
+
+
+def run(broker_path: str):
+    from parsing.distributed import work
+    work(SQLiteBroker(broker_path))
+
+
+def main(argv: List[str] = None):
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument('--broker', default=DEFAULT_PATH,
+                           help='path of the SQLite broker file')
+    argparser.add_argument('--processes', type=int, default=1)
+    args = argparser.parse_args(argv)
+
+    broker_path = os.path.abspath(args.broker)
+    spawn = multiprocessing.get_context('spawn')
+    processes = [
+        spawn.Process(target=run, args=(broker_path,))
+        for _ in range(args.processes - 1)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        run(broker_path)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
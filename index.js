@@ -43,16 +43,17 @@ app.on("ready", () => {
         keywords: data.search_terms,
         max_pages: Number(data.max_pages),
       })
+      .then((responce) => waitForJob(responce.data.job_id))
       .then(
-        (responce) => {
+        (job) => {
           e.sender.send("parsing-complete", {
-            success: responce.status == 201,
-            status: responce.status,
-            data: responce.data,
+            success: job.status == "done",
+            status: job.status,
+            data: job,
           });
         },
         (error) => {
-          console.error(e);
+          console.error(error);
           e.sender.send("parsing-complete", { success: false, error: error });
         }
       )
@@ -60,6 +61,19 @@ app.on("ready", () => {
   });
 });
 
+const JOB_POLL_INTERVAL = 1000;
+const FINISHED_JOB_STATUSES = ["done", "failed", "cancelled"];
+
+async function waitForJob(job_id) {
+  while (true) {
+    const responce = await axios.get(`http://127.0.0.1:5000/jobs/${job_id}`);
+    if (FINISHED_JOB_STATUSES.includes(responce.data.status)) {
+      return responce.data;
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+  }
+}
+
 app.on("window-all-closed", () => {
   console.log('Exiting server...')
   server_finalize();